@@ -1,8 +1,12 @@
 import math
+import multiprocessing
+import os
 import random
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
-from typing import Callable, Tuple
+from typing import Callable, NamedTuple, Optional, Tuple
 
 Vector = Tuple[float, ...]
 
@@ -12,11 +16,16 @@ def prod(iterable):
 
 
 def norm(xv: Vector) -> float:
-    return math.sqrt(sum(x ** 2 for x in xv))
+    return math.sqrt(squared_norm(xv))
+
+
+def squared_norm(xv: Vector) -> float:
+    return sum(x * x for x in xv)
 
 
 def happy_cat(xv: Vector) -> float:
-    return ((norm(xv) ** 2 - 4) ** 2) ** (0.125) + 0.25 * (0.5 * norm(xv) ** 2 + sum(xv)) + 0.5
+    sq = squared_norm(xv)
+    return ((sq - 4) ** 2) ** (0.125) + 0.25 * (0.5 * sq + sum(xv)) + 0.5
 
 
 def griewank(xv: Vector) -> float:
@@ -31,10 +40,62 @@ def random_vector(n: int) -> Vector:
     return tuple(random.gauss(0, 0.001) for i in range(n))
 
 
+# tweaks scored per inner step; larger batches keep the best of fewer moves and slow the chain down
+BATCH_SIZE = 1
+
+
 def now() -> float:
     return time.time()
 
 
+class Evaluated(NamedTuple):
+    solution: Vector
+    quality: float
+
+
+class Evaluator:
+    """
+    Scores solutions with a quality function, counting the calls made
+    and the calls saved by reusing scores already stored in Evaluated records.
+    """
+
+    def __init__(self, quality: Callable[[Vector], float]):
+        self.quality = quality
+        self.evaluations = 0
+        self.saved = 0
+
+    def __call__(self, solution: Vector) -> Evaluated:
+        self.evaluations += 1
+        return Evaluated(solution, self.quality(solution))
+
+    def __str__(self):
+        return f"{self.evaluations} evaluations, {self.saved} saved by caching"
+
+    def cached(self, evaluated: Evaluated) -> float:
+        self.saved += 1
+        return evaluated.quality
+
+
+class SharedIncumbent:
+    """
+    Best solution found by any of the chains, kept in shared memory
+    as the vector followed by its quality.
+    """
+
+    def __init__(self, dimension: int):
+        self._values = multiprocessing.Array("d", [math.inf] * (dimension + 1))
+
+    def offer(self, evaluated: Evaluated) -> None:
+        with self._values.get_lock():
+            if evaluated.quality < self._values[-1]:
+                self._values[:] = [*evaluated.solution, evaluated.quality]
+
+    def get(self) -> Evaluated:
+        with self._values.get_lock():
+            *solution, quality = self._values[:]
+        return Evaluated(tuple(solution), quality)
+
+
 def tweak_factory(sigma: float) -> Callable[[Vector], Vector]:
     return lambda xv: tuple(x + random.gauss(0, sigma) for x in xv)
 
@@ -45,48 +106,143 @@ def iterated_local_search(
     initial: Vector,
     quality: Callable[[Vector], float],
     timeout: float,
+    batch_size: int = 1,
+    incumbent: Optional[SharedIncumbent] = None,
+    patience: int = 10,
 ) -> Vector:
-    s = initial
+    """
+    Minimizes quality via iterated local search.
+
+    Every inner step draws a block of batch_size tweaks of the current solution
+    and keeps the best of them, so the clock is read once per block.
+    With an incumbent shared between chains, every new best is published there,
+    and after patience restarts without a better homebase the chain moves
+    its homebase to the shared best if that one is better.
+    """
+    evaluate = Evaluator(quality)
+    s = evaluate(initial)
     best = s
     homebase = s
+    stalled = 0
     start = now()
     while now() - start < timeout:
         t = 0.01
 
         st = now()
         while now() - st < t and now() - start < timeout:
-            r = tweak(s)
-            if quality(r) < quality(s):
+            candidates = map(evaluate, (tweak(s.solution) for _ in range(batch_size)))
+            r = min(candidates, key=lambda e: e.quality)
+            if r.quality < evaluate.cached(s):
                 s = r
 
-        if quality(s) <= quality(best):
+        if evaluate.cached(s) <= evaluate.cached(best):
             best = s
+            if incumbent:
+                incumbent.offer(best)
 
-        if quality(s) <= quality(homebase):
+        if evaluate.cached(s) <= evaluate.cached(homebase):
             homebase = s
+            stalled = 0
+        else:
+            stalled += 1
+
+        if incumbent and stalled >= patience:
+            shared = incumbent.get()
+            if shared.quality < homebase.quality:
+                homebase = shared
+            stalled = 0
 
-        s = large_tweak(homebase)
+        s = evaluate(large_tweak(homebase.solution))
 
-    return (*best, quality(best))
+    print(evaluate, file=sys.stderr)
+    return (*best.solution, evaluate.cached(best))
+
+
+_incumbent: Optional[SharedIncumbent] = None
+
+
+def _init_chain(incumbent: SharedIncumbent) -> None:
+    global _incumbent
+    _incumbent = incumbent
+
+
+def _run_chain(
+    seed: int,
+    sigma: float,
+    large_sigma: float,
+    quality: Callable[[Vector], float],
+    dimension: int,
+    deadline: float,
+    batch_size: int,
+) -> Vector:
+    random.seed(seed)
+    return iterated_local_search(
+        tweak=tweak_factory(sigma),
+        large_tweak=tweak_factory(large_sigma),
+        initial=random_vector(dimension),
+        quality=quality,
+        timeout=deadline - now(),
+        batch_size=batch_size,
+        incumbent=_incumbent,
+    )
+
+
+def multi_start_iterated_local_search(
+    chains: int,
+    sigma: float,
+    large_sigma: float,
+    quality: Callable[[Vector], float],
+    dimension: int,
+    timeout: float,
+    batch_size: int = 1,
+) -> Vector:
+    """
+    Runs independent iterated local search chains in worker processes,
+    each seeded with its own random stream and sharing the best solution found so far.
+    All chains stop at the same wall-clock deadline.
+
+    Returns:
+        Best solution found by any chain followed by its quality
+    """
+    deadline = now() + timeout
+    incumbent = SharedIncumbent(dimension)
+    seeds = [random.randrange(2 ** 32) for _ in range(chains)]
+    with ProcessPoolExecutor(chains, initializer=_init_chain, initargs=(incumbent,)) as executor:
+        futures = [
+            executor.submit(_run_chain, seed, sigma, large_sigma, quality, dimension, deadline, batch_size)
+            for seed in seeds
+        ]
+        results = [future.result() for future in futures]
+    return min(results, key=lambda result: result[-1])
 
 
 def main():
-    t, b = input().split()
+    t, b, *rest = input().split()
+    # chains beyond the number of cores only share them, leaving every chain fewer moves
+    chains = min(int(rest[0]) if rest else 1, os.cpu_count() or 1)
     if b == "0":
-        result = iterated_local_search(
-            tweak=tweak_factory(0.0001),
-            large_tweak=tweak_factory(0.00001),
-            initial=random_vector(4),
-            quality=happy_cat,
+        sigma, large_sigma, quality = 0.0001, 0.00001, happy_cat
+    else:
+        sigma, large_sigma, quality = 0.000001, 0.00000001, griewank
+
+    if chains > 1:
+        result = multi_start_iterated_local_search(
+            chains=chains,
+            sigma=sigma,
+            large_sigma=large_sigma,
+            quality=quality,
+            dimension=4,
             timeout=float(t),
+            batch_size=BATCH_SIZE,
         )
     else:
         result = iterated_local_search(
-            tweak=tweak_factory(0.000001),
-            large_tweak=tweak_factory(0.00000001),
+            tweak=tweak_factory(sigma),
+            large_tweak=tweak_factory(large_sigma),
             initial=random_vector(4),
-            quality=griewank,
+            quality=quality,
             timeout=float(t),
+            batch_size=BATCH_SIZE,
         )
 
     print(" ".join(map(str, result)))
@@ -0,0 +1,30 @@
+from heapq import nsmallest
+from typing import List, Optional
+
+
+def greedy_path(costs: List[List[int]], nearest: Optional[List[List[int]]] = None) -> List[int]:
+    """
+    Nearest neighbour tour starting and ending in city 0.
+    With candidate lists, the next city is looked up among the nearest cities first
+    and the unvisited cities are scanned only when all of them are visited.
+    """
+    n = len(costs)
+    visited = bytearray(n)
+    visited[0] = 1
+    unvisited = list(range(1, n))
+    index = list(range(-1, n - 1))  # position of every city in unvisited
+
+    path = [0]
+    curr_city = 0
+    while unvisited:
+        row = costs[curr_city]
+        listed = [c for c in nearest[curr_city] if not visited[c]] if nearest else []
+        curr_city = listed[0] if listed else min(unvisited, key=row.__getitem__)
+
+        visited[curr_city] = 1
+        last = unvisited.pop()
+        if last != curr_city:
+            unvisited[index[curr_city]] = last
+            index[last] = index[curr_city]
+        path.append(curr_city)
+    return path + [0]
@@ -1,111 +1,559 @@
-import math
+import collections
+import os
+import pickle
 import random
 import sys
 import time
+from array import array
 from collections import deque
-from copy import deepcopy
-from typing import Any, Callable, Deque, List, Tuple
+from functools import lru_cache
+from heapq import heapify, heappop, nsmallest
+from typing import Any, Callable, Counter, Deque, Dict, Hashable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from .construction import greedy_path
+except ImportError:
+    from construction import greedy_path
+
+
+FULL_NEIGHBOURHOOD_SIZE = 200
+NEAREST = 10
+
+# seconds between checkpoints of a search state
+CHECKPOINT_INTERVAL = 60.0
 
 
 def now():
     return time.time()
 
 
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """
+    Writes the state of a search to path atomically:
+    to a temporary file first, which then replaces the previous checkpoint.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
 class TabuList:
-    def __init__(self, max_size: int):
-        self._list: Deque[Any] = deque([], max_size)
+    """
+    Keeps the keys of the last max_size pushed elements.
+    A counter of the keys makes membership checks constant time.
+    """
+
+    def __init__(self, max_size: int, key: Optional[Callable[[Any], Hashable]] = None):
+        self.max_size = max_size
+        self.key = key or (lambda element: element)
+        self._list: Deque[Hashable] = deque()
+        self._counts: Counter[Hashable] = collections.Counter()
 
     def push(self, element: Any):
-        self._list.append(element)
+        self.push_key(self.key(element))
+
+    def push_key(self, key: Hashable):
+        self._list.append(key)
+        self._counts[key] += 1
+        if len(self._list) > self.max_size:
+            oldest = self._list.popleft()
+            self._counts[oldest] -= 1
+            if not self._counts[oldest]:
+                del self._counts[oldest]
 
     def __str__(self):
         return str(list(self._list))
 
+    def keys(self) -> List[Hashable]:
+        return list(self._list)
+
     def contains(self, element: Any):
-        return element in self._list
+        return self.key(element) in self._counts
+
+
+class Move(NamedTuple):
+    kind: str  # "swap", "reverse", "or-opt" or "or-3opt"
+    i: int
+    j: int
+    k: int = 0
+
+
+# moves exchanging the adjacent segments path[i:j] and path[j:k]
+SEGMENT_MOVES = ("or-opt", "or-3opt")
+
+
+Edge = Tuple[int, int]
+
+MASK = 2 ** 64 - 1
+
+
+def is_symmetric(costs: List[List[int]]) -> bool:
+    return all(costs[i][j] == costs[j][i] for i in range(len(costs)) for j in range(i))
+
+
+def prefix_sums(costs: List[List[int]], path: Sequence[int]) -> List[int]:
+    sums = [0]
+    for a, b in zip(path, path[1:]):
+        sums.append(sums[-1] + costs[a][b])
+    return sums
+
+
+class TSP:
+    def __init__(self, costs: List[List[int]]):
+        self.costs = costs
+        self.n = len(costs)
+        self.symmetric = is_symmetric(costs)
+        self.transposed = costs if self.symmetric else [list(row) for row in zip(*costs)]
+        self.keys = [random.getrandbits(64) | 1 for _ in range(self.n)]
+
+    def edge(self, a: int, b: int) -> Edge:
+        return (min(a, b), max(a, b)) if self.symmetric else (a, b)
+
+    def edge_hash(self, a: int, b: int) -> int:
+        """
+        Hash of an edge, regardless of its direction only on symmetric instances.
+        A tour hashes to the sum of its edge hashes, so moves update it in constant time.
+        """
+        if self.symmetric:
+            return self.keys[a] * self.keys[b] & MASK
+        key = self.keys[b]
+        return self.keys[a] * ((key << 32 | key >> 32) & MASK) & MASK
+
+    def path_hash(self, path: Sequence[int]) -> int:
+        return sum(self.edge_hash(a, b) for a, b in zip(path, path[1:])) & MASK
+
+    @lru_cache(maxsize=None)
+    def nearest(self, k: int) -> List[List[int]]:
+        """
+        For every city returns the k cities cheapest to go to from it.
+        """
+        return [
+            nsmallest(k, (b for b in range(self.n) if b != a), key=self.costs[a].__getitem__) for a in range(self.n)
+        ]
+
+
+class Tour:
+    """
+    A path with its cost, hash and prefix sums of its edge costs.
+    Moves are scored and hashed from the edges they touch, without building the moved path.
+    The path is an array of ints, so copying and slicing it are plain memory copies.
+    """
+
+    def __init__(self, tsp: TSP, path: Sequence[int]):
+        self.tsp = tsp
+        self.path = path if isinstance(path, array) else array("i", path)
+        self.forward = prefix_sums(tsp.costs, self.path)
+        self.backward = [] if tsp.symmetric else prefix_sums(tsp.transposed, self.path)
+        self.cost = self.forward[-1]
+        self.hash = tsp.path_hash(self.path)
+        self.position = [0] * tsp.n
+        for k, city in enumerate(self.path[:-1]):
+            self.position[city] = k
+
+    def edges(self, move: Move) -> Tuple[List[Edge], List[Edge]]:
+        """
+        Returns edges removed and added by a move.
+        For a reversal only the two edges at its ends are listed.
+        """
+        path = self.path
+        if move.kind in SEGMENT_MOVES:
+            _, i, j, k = move
+            return (
+                [(path[i - 1], path[i]), (path[j - 1], path[j]), (path[k - 1], path[k])],
+                [(path[i - 1], path[j]), (path[k - 1], path[i]), (path[j - 1], path[k])],
+            )
+        if move.kind == "swap":
+            i, j = min(move.i, move.j), max(move.i, move.j)
+
+            def city(k):
+                return path[j] if k == i else path[i] if k == j else path[k]
+
+            touched = {i - 1, i, j - 1, j}
+            return (
+                [(path[k], path[k + 1]) for k in touched],
+                [(city(k), city(k + 1)) for k in touched],
+            )
+
+        i, j = move.i, move.j
+        if j - i < 2:
+            return [], []
+        return (
+            [(path[i - 1], path[i]), (path[j - 1], path[j])],
+            [(path[i - 1], path[j - 1]), (path[i], path[j])],
+        )
+
+    def delta(self, move: Move) -> int:
+        costs = self.tsp.costs
+        removed, added = self.edges(move)
+        delta = sum(costs[a][b] for a, b in added) - sum(costs[a][b] for a, b in removed)
+        if move.kind == "reverse" and not self.tsp.symmetric and move.j - move.i >= 2:
+            i, j = move.i, move.j
+            delta += (self.backward[j - 1] - self.backward[i]) - (self.forward[j - 1] - self.forward[i])
+        return delta
 
+    def move_hash(self, move: Move) -> int:
+        edge_hash = self.tsp.edge_hash
+        removed, added = self.edges(move)
+        return (
+            self.hash + sum(edge_hash(a, b) for a, b in added) - sum(edge_hash(a, b) for a, b in removed)
+        ) & MASK
 
-def random_path(n: int) -> List[int]:
-    result: List[int] = []
-    for _ in range(n - 2):
-        result.append(random.choice(list(set(range(1, n - 1)) - set(result))))
-    return [0] + result + [0]
+    def apply(self, move: Move) -> "Tour":
+        path = self.path
+        if move.kind == "swap":
+            path = path[:]
+            path[move.i], path[move.j] = path[move.j], path[move.i]
+        elif move.kind in SEGMENT_MOVES:
+            path = path[: move.i] + path[move.j : move.k] + path[move.i : move.j] + path[move.k :]
+        else:
+            path = path[: move.i] + path[move.i : move.j][::-1] + path[move.j :]
+        return Tour(self.tsp, path)
 
 
-def greedy_path(costs: List[List[int]]) -> List[int]:
-    path = [0]
-    curr_city = 0
-    while len(path) < len(costs):
-        min_cost = math.inf
-        min_index = 0
+def or_opt_move(tour: Tour) -> Move:
+    """
+    Moves a segment of one to three cities forward or backward, keeping its direction.
+    """
+    n = len(tour.path)
+    length = random.randint(1, min(3, n - 3))
+    i = random.randrange(1, n - length)
+    if i + length < n - 1 and (i == 1 or random.random() < 0.5):
+        return Move("or-opt", i, i + length, random.randrange(i + length + 1, n))
+    return Move("or-opt", random.randrange(1, i), i, i + length)
 
-        for i, _ in enumerate(costs[curr_city]):
-            if costs[curr_city][i] < min_cost and i not in path:
-                min_cost = costs[curr_city][i]
-                min_index = i
 
-        path.append(min_index)
-        curr_city = min_index
-    return path + [0]
+def or_3opt_move(tour: Tour) -> Move:
+    """
+    Exchanges two adjacent segments of any length, keeping their directions.
+    """
+    i, j, k = sorted(random.sample(range(1, len(tour.path)), 3))
+    return Move("or-3opt", i, j, k)
 
 
-def tweak_path(path: List[int]) -> List[int]:
-    if random.random() < 0.7:
-        city1 = random.randrange(1, len(path) - 1)
-        city2 = random.choice([c for c in range(1, len(path) - 1) if c != city1])
-        path[city1], path[city2] = path[city2], path[city1]
-        return path
-    city1 = random.randrange(1, len(path) - 2)
-    city2 = random.choice([c for c in range(1, len(path) - 1) if c > city1])
-    return path[:city1] + list(reversed(path[city1:city2])) + path[city2:]
+Candidate = Tuple[int, Move]
 
 
-def path_cost(costs: List[List[int]]) -> Callable[[List[int]], int]:
-    return lambda path: sum(costs[path[i]][path[i + 1]] for i in range(len(path) - 1))
+def nearest_move_factory(tsp: TSP, k: int) -> Callable[[Tour], Move]:
+    """
+    Random swaps and reversals which put one of the k nearest cities
+    right after the city at a random position.
+    Asymmetric instances get only swaps, as a reversal reverses the edges inside it.
+    """
+    nearest = tsp.nearest(k)
+
+    def nearest_move(tour: Tour) -> Move:
+        path = tour.path
+        while True:
+            i = random.randrange(1, len(path) - 1)
+            j = tour.position[random.choice(nearest[path[i - 1]])]
+            if j == 0:
+                continue
+            if random.random() < 0.7 or not tsp.symmetric:
+                return Move("swap", i, j)
+            if j > i:
+                return Move("reverse", i, j + 1)
+            if j < i - 2:
+                return Move("reverse", j + 1, i)
+
+    return nearest_move
+
+
+def nearest_segment_move_factory(tsp: TSP, k: int) -> Callable[[Tour], Move]:
+    """
+    Random exchanges of adjacent segments which put one of the k nearest cities
+    right after the city at a random position, keeping the directions of the segments.
+    """
+    nearest = tsp.nearest(k)
+
+    def nearest_segment_move(tour: Tour) -> Move:
+        path = tour.path
+        while True:
+            i = random.randrange(1, len(path) - 1)
+            j = tour.position[random.choice(nearest[path[i - 1]])]
+            if i < j < len(path) - 1:
+                return Move("or-3opt", i, j, random.randrange(j + 1, len(path)))
+            if 0 < j < i - 1:
+                return Move("or-3opt", j, random.randrange(j + 1, i), i)
+
+    return nearest_segment_move
+
+
+class Neighbourhood:
+    """
+    Yields moves out of a tour together with their cost deltas.
+    """
+
+    def __call__(self, tour: Tour) -> Iterator[Candidate]:
+        raise NotImplementedError
+
+    def accept(self, tour: Tour, move: Move) -> None:
+        """
+        Called by the search with the tour a move is applied to.
+        """
+
+
+class AdaptiveNeighbourhood(Neighbourhood):
+    """
+    Samples moves from several operators.
+    An operator is drawn with probability growing with how much its applied moves
+    have recently shortened the tour, and never lower than min_probability.
+    """
+
+    def __init__(
+        self,
+        operators: List[Callable[[Tour], Move]],
+        size: int,
+        decay: float = 0.9,
+        min_probability: float = 0.1,
+    ):
+        self.operators = operators
+        self.size = size
+        self.decay = decay
+        self.min_probability = min_probability
+        self.scores = [0.0] * len(operators)
+        self.origin: Dict[Move, int] = {}
+
+    def weights(self) -> List[float]:
+        total = sum(self.scores)
+        if not total:
+            return [1.0] * len(self.scores)
+        spread = 1 - self.min_probability * len(self.scores)
+        return [self.min_probability + spread * score / total for score in self.scores]
+
+    def __call__(self, tour: Tour) -> Iterator[Candidate]:
+        self.origin = {}
+        for index in random.choices(range(len(self.operators)), self.weights(), k=self.size):
+            move = self.operators[index](tour)
+            self.origin[move] = index
+            yield tour.delta(move), move
+
+    def accept(self, tour: Tour, move: Move) -> None:
+        self.scores = [self.decay * score for score in self.scores]
+        if move in self.origin:
+            self.scores[self.origin[move]] += (1 - self.decay) * max(0, -tour.delta(move))
+
+
+class CandidateNeighbourhood(Neighbourhood):
+    """
+    Swaps and reversals which put one of the k nearest cities right after a city.
+    A city whose moves gave no improvement gets its don't-look bit set and is skipped
+    until a move changes one of its edges, or until every city has the bit set.
+    """
+
+    def __init__(self, tsp: TSP, k: int):
+        self.nearest = tsp.nearest(k)
+        self.dont_look = bytearray(tsp.n)
+
+    def __call__(self, tour: Tour) -> Iterator[Candidate]:
+        path, position = tour.path, tour.position
+        n = len(path)
+        if all(self.dont_look):
+            self.dont_look = bytearray(len(self.dont_look))
+
+        for i in range(1, n - 1):
+            a = path[i - 1]
+            if self.dont_look[a]:
+                continue
+            improving = False
+            for c in self.nearest[a]:
+                j = position[c]
+                if j == 0:
+                    continue
+                moves = [Move("swap", i, j)]
+                if j > i:
+                    moves.append(Move("reverse", i, j + 1))
+                elif j < i - 2:
+                    moves.append(Move("reverse", j + 1, i))
+                for move in moves:
+                    delta = tour.delta(move)
+                    improving = improving or delta < 0
+                    yield delta, move
+            if not improving:
+                self.dont_look[a] = 1
+
+    def accept(self, tour: Tour, move: Move) -> None:
+        removed, added = tour.edges(move)
+        for edge in removed + added:
+            for city in edge:
+                self.dont_look[city] = 0
+
+
+class FullNeighbourhood(Neighbourhood):
+    """
+    Every swap and every reversal of the tour.
+    Deltas of a whole row of moves sharing the first position are computed in one pass
+    over slices of the path and of its edge costs.
+    """
+
+    def __call__(self, tour: Tour) -> Iterator[Candidate]:
+        path, costs, transposed = tour.path, tour.tsp.costs, tour.tsp.transposed
+        n = len(path)
+        edge = [b - a for a, b in zip(tour.forward, tour.forward[1:])]
+        # cost change of reversing the edges before position k
+        internal = [b - f for b, f in zip(tour.backward, tour.forward)] if tour.backward else [0] * n
+
+        for i in range(1, n - 1):
+            a, b, c = path[i - 1], path[i], path[i + 1]
+            row_a, row_b, column_b, column_c = costs[a], costs[b], transposed[b], transposed[c]
+
+            if i + 1 < n - 1:
+                move = Move("swap", i, i + 1)
+                yield tour.delta(move), move
+
+            removed = edge[i - 1] + edge[i]
+            deltas = (
+                row_a[q] + column_c[q] + column_b[p] + row_b[r] - removed - e1 - e2
+                for p, q, r, e1, e2 in zip(
+                    path[i + 1 : n - 2], path[i + 2 : n - 1], path[i + 3 :], edge[i + 1 :], edge[i + 2 :]
+                )
+            )
+            for j, delta in zip(range(i + 2, n - 1), deltas):
+                yield delta, Move("swap", i, j)
+
+            removed = edge[i - 1] + internal[i]
+            deltas = (
+                row_a[p] + row_b[q] - removed - e + d
+                for p, q, e, d in zip(path[i + 1 : n - 1], path[i + 2 :], edge[i + 1 :], internal[i + 1 :])
+            )
+            for j, delta in zip(range(i + 2, n), deltas):
+                yield delta, Move("reverse", i, j)
 
 
 def tabu_search(
-    initial: List[int],
-    tweak: Callable[[List[int]], List[int]],
-    quality: Callable[[List[int]], int],
+    initial: Tour,
+    neighbourhood: Neighbourhood,
     tabu_size: int,
-    num_of_tweaks: int,
     timeout: float,
-) -> Tuple[List[int], int]:
-    s = initial
-    best = s
+    attributes: bool = False,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    resume_from: Optional[str] = None,
+) -> Tuple[Sequence[int], int]:
+    """
+    Every step scores the neighbourhood of the current tour by cost deltas
+    and applies the best move which is not tabu, or is tabu but gives a new best tour.
+
+    By default the tabu list holds hashes of visited tours. On asymmetric instances reversals are rejected then,
+    as the hash of a reversed tour would need every edge it reverses.
+    With attributes, it holds edges removed by recent moves instead,
+    and moves adding any of them back are tabu.
+
+    With checkpoint, the current and best tours, the tabu list, the city keys its tour hashes are made of
+    and the state of the random generator are saved to that file every checkpoint_interval seconds and at the end.
+    resume_from continues from such a file, with initial giving only the instance
+    and the time already spent counting towards the timeout.
+    Learned neighbourhood state, like operator weights, starts afresh.
+    """
     tabu = TabuList(tabu_size)
-    tabu.push(s)
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        # the saved tour hashes are made of the saved city keys
+        initial.tsp.keys = state["keys"]
+        s = Tour(initial.tsp, state["current"])
+        best = Tour(initial.tsp, state["best"])
+        for key in state["tabu"]:
+            tabu.push_key(key)
+        scored, rebuilt = state["counters"]
+        random.setstate(state["random"])
+        start = now() - state["elapsed"]
+    else:
+        s = initial
+        best = s
+        if not attributes:
+            tabu.push(s.hash)
+        scored = rebuilt = 0
+        start = now()
+
+    def save():
+        state = {
+            "current": s.path,
+            "best": best.path,
+            "tabu": tabu.keys(),
+            "keys": s.tsp.keys,
+            "counters": (scored, rebuilt),
+            "random": random.getstate(),
+            "elapsed": now() - start,
+        }
+        save_checkpoint(checkpoint, state)
 
-    start = now()
+    def is_tabu(move: Move) -> bool:
+        if attributes:
+            _, added = s.edges(move)
+            return any(tabu.contains(s.tsp.edge(a, b)) for a, b in added)
+        return tabu.contains(s.move_hash(move))
+
+    def is_hashed(move: Move) -> bool:
+        return attributes or s.tsp.symmetric or move.kind != "reverse"
+
+    last_checkpoint = now()
     while now() - start <= timeout:
-        r = tweak(deepcopy(s))
-        for _ in range(num_of_tweaks):
+        candidates = []
+        for candidate in neighbourhood(s):
             if now() - start > timeout:
                 break
-            w = tweak(deepcopy(s))
-            if not tabu.contains(w) and (tabu.contains(r) or quality(w) < quality(r)):
-                r = w
-        if not tabu.contains(r):
-            s = r
-            tabu.push(r)
-        if quality(s) < quality(best):
-            print(f"new best! {quality(s)} - after {now() - start} s.", file=sys.stderr)
+            candidates.append(candidate)
+        scored += len(candidates)
+
+        heapify(candidates)
+        while candidates:
+            delta, move = heappop(candidates)
+            if not is_hashed(move) or is_tabu(move) and s.cost + delta >= best.cost:
+                continue
+            if attributes:
+                for a, b in s.edges(move)[0]:
+                    tabu.push(s.tsp.edge(a, b))
+            neighbourhood.accept(s, move)
+            s = s.apply(move)
+            rebuilt += 1
+            if not attributes:
+                tabu.push(s.hash)
+            break
+        if s.cost < best.cost:
+            print(f"new best! {s.cost} - after {now() - start} s.", file=sys.stderr)
             best = s
-    return best, quality(best)
+        if checkpoint is not None and now() - last_checkpoint >= checkpoint_interval:
+            save()
+            last_checkpoint = now()
+    if checkpoint is not None:
+        save()
+    print(f"{scored} moves scored by delta, {rebuilt} paths rebuilt", file=sys.stderr)
+    return best.path, best.cost
 
 
 def main():
     t, n = map(int, input().split())
     costs = [[*map(int, input().split())] for i in range(n)]
+    # an optional argument names a checkpoint file, resumed from when it exists
+    checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
+
+    tsp = TSP(costs)
+    neighbourhood: Neighbourhood
+    if not tsp.symmetric:
+        neighbourhood = AdaptiveNeighbourhood(
+            [nearest_move_factory(tsp, NEAREST), nearest_segment_move_factory(tsp, NEAREST), or_opt_move, or_3opt_move],
+            size=n * NEAREST,
+        )
+    elif n <= FULL_NEIGHBOURHOOD_SIZE:
+        neighbourhood = FullNeighbourhood()
+    else:
+        neighbourhood = CandidateNeighbourhood(tsp, NEAREST)
 
     path, cost = tabu_search(
-        initial=greedy_path(costs),
-        tweak=tweak_path,
-        quality=path_cost(costs),
+        initial=Tour(tsp, greedy_path(costs, tsp.nearest(NEAREST))),
+        neighbourhood=neighbourhood,
         tabu_size=n * 10,
-        num_of_tweaks=int(n ** 2 / 3),
         timeout=float(t),
+        checkpoint=checkpoint,
+        resume_from=resume_from,
     )
 
     print(*list(map(lambda city: city + 1, path)), file=sys.stderr)
@@ -1,10 +1,12 @@
+import collections
+import os
+import pickle
 import random
 import sys
 import time
 from collections import deque
-from copy import deepcopy
 from enum import Enum
-from typing import Any, Callable, Deque, List, Tuple
+from typing import Any, Callable, Counter, Deque, Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
 
 
 class Move(Enum):
@@ -14,6 +16,20 @@ class Move(Enum):
     L = 0, -1
 
 
+MOVE_INDEX = {move.value: k for k, move in enumerate(Move)}
+
+Undo = Callable[[], None]
+
+# mazes with more fields get only a bound on the shortest path
+EXACT_LIMIT = 10 ** 6
+
+# seconds between checkpoints of a search state
+CHECKPOINT_INTERVAL = 60.0
+
+# seed of the random keys hashing moves at path positions, fixed so that checkpointed hashes stay valid
+ZOBRIST_SEED = 0
+
+
 class Field(Enum):
     EMPTY = "0"
     WALL = "1"
@@ -33,16 +49,69 @@ class Maze:
         )
         self.size = len(maze_map) * len(maze_map[0])
         self.n, self.m = len(maze_map), len(maze_map[0])
+        self._reference: Optional[List[Move]] = None
+        self._trace: List[Tuple[int, int]] = []
+        self._cost = 0
+        self._edit: Optional[Tuple[int, int]] = None
+        self._hash = 0
+        self._keys: List[Tuple[int, ...]] = []
+        self._key_random = random.Random(ZOBRIST_SEED)
+
+    def _key(self, i: int, move: Tuple[int, int]) -> int:
+        while len(self._keys) <= i:
+            self._keys.append(tuple(self._key_random.getrandbits(64) for _ in Move))
+        return self._keys[i][MOVE_INDEX[move]]
+
+    def fingerprint(self, path: List[Move]) -> int:
+        """
+        Zobrist hash of the path: XOR of random keys of the moves at their positions.
+        The path last passed to tweak_path has its hash updated from the positions a tweak changes.
+        """
+        if path is self._reference:
+            return self._hash
+        h = 0
+        for i, move in enumerate(path):
+            h ^= self._key(i, move)
+        return h
 
     def path_cost(self, path: List[Move]) -> int:
-        pos = self.start
-        cost = 0
-        for i, move in enumerate(path):
+        """
+        Number of moves made until the exit is reached.
+
+        The path last passed to tweak_path keeps the positions of its walk.
+        While it is tweaked, it is scored from the position before its first changed move,
+        and scoring stops as soon as the walk after the changed moves rejoins the stored one.
+        """
+        if path is self._reference:
+            if self._edit is None:
+                return self._cost
+            first, last = self._edit
+            if first >= len(self._trace):
+                return self._cost
+            return self._walk(path, first, self._trace[first], rejoin=last)
+        return self._walk(path)
+
+    def _walk(
+        self,
+        path: List[Move],
+        first: int = 0,
+        pos: Optional[Tuple[int, int]] = None,
+        trace: Optional[List[Tuple[int, int]]] = None,
+        rejoin: Optional[int] = None,
+    ) -> int:
+        pos = self.start if pos is None else pos
+        cost = first
+        for i in range(first, len(path)):
+            if rejoin is not None and rejoin <= i < len(self._trace) and pos == self._trace[i]:
+                return self._cost
+            if trace is not None:
+                trace.append(pos)
+
             cost = i + 1
             if cost >= self.size:
                 return self.size
 
-            x, y = tuple_sum(pos, move)
+            x, y = tuple_sum(pos, path[i])
 
             if x not in range(self.n) or y not in range(self.m):
                 return self.size
@@ -55,6 +124,59 @@ class Maze:
 
         return cost
 
+    def _track(self, path: List[Move], change: Undo, positions: Iterable[int]) -> Undo:
+        """
+        Applies an involutive change of the moves at the given increasing positions, returning its undo.
+        """
+        if path is not self._reference:
+            self._trace = []
+            self._cost = self._walk(path, trace=self._trace)
+            self._hash = self.fingerprint(path)
+            self._reference, self._edit = path, None
+
+        positions = list(positions)
+        first, last = positions[0], positions[-1] + 1
+        previous, previous_hash = self._edit, self._hash
+        self._edit = (first, last) if previous is None else (min(first, previous[0]), max(last, previous[1]))
+        for i in positions:
+            self._hash ^= self._key(i, path[i])
+        change()
+        for i in positions:
+            self._hash ^= self._key(i, path[i])
+
+        def undo():
+            change()
+            self._edit, self._hash = previous, previous_hash
+
+        return undo
+
+    def lower_bound(self, exact_limit: int = EXACT_LIMIT) -> int:
+        """
+        Length of the shortest path to the exit, found by breadth-first search.
+        Mazes with more than exact_limit fields get the Manhattan distance
+        to the nearest exit instead. Returns 0 when there is no exit to reach.
+        """
+        exits = [(i, j) for i, row in enumerate(self.map) for j, field in enumerate(row) if field == Field.EXIT.value]
+        if not exits:
+            return 0
+        if self.size > exact_limit:
+            return min(abs(x - self.start[0]) + abs(y - self.start[1]) for x, y in exits)
+
+        distance = {self.start: 0}
+        queue = deque([self.start])
+        while queue:
+            pos = queue.popleft()
+            for move in Move:
+                x, y = tuple_sum(pos, move.value)
+                if x not in range(self.n) or y not in range(self.m) or (x, y) in distance:
+                    continue
+                if self.map[x][y] == Field.EXIT.value:
+                    return distance[pos] + 1
+                if self.map[x][y] != Field.WALL.value:
+                    distance[x, y] = distance[pos] + 1
+                    queue.append((x, y))
+        return 0
+
     def neighbours(self, pos):
         n = [tuple_sum(pos, move.value) for move in Move]
         return [((x, y), self.map[x][y]) for x, y in n]
@@ -64,18 +186,29 @@ class Maze:
         moves = [m.value for m in Move]
         return moves[(moves.index(move) + 1) % 4]
 
-    @staticmethod
-    def tweak_path(path):
+    def tweak_path(self, path: List[Move]) -> Undo:
+        """
+        Swaps two moves or reverses a segment of the path in place.
+        Both are undone by applying them again.
+        """
         if len(path) < 2:
-            return path
+            return lambda: None
         if random.random() < 0.6:
             i = random.randrange(len(path))
-            j = random.choice([c for c in range(1, len(path) - 1) if c < i - 1 or c > i + 1])
-            path[i], path[j] = path[j], path[i]
-            return path
+            j = random.randrange(1, len(path) - 1) if len(path) > 2 else i
+            if abs(i - j) > 1:
+
+                def swap():
+                    path[i], path[j] = path[j], path[i]
+
+                return self._track(path, swap, sorted((i, j)))
         i = random.randrange(len(path) - 1)
-        j = random.choice([c for c in range(len(path)) if c > i])
-        return path[:i] + list(reversed(path[i:j])) + path[j:]
+        j = random.randrange(i + 1, len(path))
+
+        def reverse():
+            path[i:j] = path[i:j][::-1]
+
+        return self._track(path, reverse, range(i, j))
 
     def init_path(self):
         path = []
@@ -98,62 +231,177 @@ class Maze:
         return path
 
 
+class Evaluated(NamedTuple):
+    solution: Any
+    quality: int
+
+
+class Evaluator:
+    """
+    Scores solutions with a quality function, counting the calls made
+    and the calls saved by reusing scores already stored in Evaluated records.
+    """
+
+    def __init__(self, quality: Callable[[Any], int]):
+        self.quality = quality
+        self.evaluations = 0
+        self.saved = 0
+
+    def __call__(self, solution: Any) -> Evaluated:
+        self.evaluations += 1
+        return Evaluated(solution, self.quality(solution))
+
+    def __str__(self):
+        return f"{self.evaluations} evaluations, {self.saved} saved by caching"
+
+    def cached(self, evaluated: Evaluated) -> int:
+        self.saved += 1
+        return evaluated.quality
+
+
 class TabuList:
-    def __init__(self, max_size: int):
-        self._list: Deque[Any] = deque([], max_size)
+    """
+    Keeps the keys of the last max_size pushed elements.
+    A counter of the keys makes membership checks constant time.
+    """
+
+    def __init__(self, max_size: int, key: Optional[Callable[[Any], Hashable]] = None):
+        self.max_size = max_size
+        self.key = key or (lambda element: element)
+        self._list: Deque[Hashable] = deque()
+        self._counts: Counter[Hashable] = collections.Counter()
 
     def push(self, element: Any):
-        self._list.append(element)
+        self.push_key(self.key(element))
+
+    def push_key(self, key: Hashable):
+        self._list.append(key)
+        self._counts[key] += 1
+        if len(self._list) > self.max_size:
+            oldest = self._list.popleft()
+            self._counts[oldest] -= 1
+            if not self._counts[oldest]:
+                del self._counts[oldest]
 
     def __str__(self):
         return str(list(self._list))
 
+    def keys(self) -> List[Hashable]:
+        return list(self._list)
+
     def contains(self, element: Any):
-        return element in self._list
+        return self.key(element) in self._counts
 
 
 def now():
     return time.time()
 
 
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """
+    Writes the state of a search to path atomically:
+    to a temporary file first, which then replaces the previous checkpoint.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
 def tuple_sum(t1, t2):
     return tuple(sum(t) for t in zip(t1, t2))
 
 
 def tabu_search(
     initial: List[Move],
-    tweak: Callable[[List[Move]], List[Move]],
+    tweak: Callable[[List[Move]], Undo],
     quality: Callable[[List[Move]], int],
     tabu_size: int,
     num_of_tweaks: int,
     timeout: float,
+    lower_bound: int = 0,
+    key: Optional[Callable[[List[Move]], Hashable]] = None,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    resume_from: Optional[str] = None,
 ) -> Tuple[List[Move], int]:
-    s = initial
-    best = s
-    tabu = TabuList(tabu_size)
-    tabu.push(s)
-
-    start = now()
-    while now() - start <= timeout:
-        r = tweak(deepcopy(s))
-        for _ in range(num_of_tweaks):
+    """
+    Tweaks change the current solution in place and return a function undoing the change,
+    so a candidate is copied only when it becomes the best one of its step.
+    The search stops early once the best quality reaches lower_bound.
+    The tabu list holds key(solution), the solution as a tuple by default.
+
+    With checkpoint, the current and best solutions, the tabu list and the state of the random generator
+    are saved to that file every checkpoint_interval seconds and at the end.
+    resume_from continues from such a file instead of initial,
+    with the time already spent counting towards the timeout.
+    """
+    evaluate = Evaluator(quality)
+    tabu = TabuList(tabu_size, key=key or tuple)
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        s = evaluate(state["current"])
+        best = evaluate(state["best"])
+        for key in state["tabu"]:
+            tabu.push_key(key)
+        random.setstate(state["random"])
+        start = now() - state["elapsed"]
+    else:
+        s = evaluate(initial)
+        best = s
+        tabu.push(s.solution)
+        start = now()
+
+    def save():
+        state = {
+            "current": s.solution,
+            "best": best.solution,
+            "tabu": tabu.keys(),
+            "random": random.getstate(),
+            "elapsed": now() - start,
+        }
+        save_checkpoint(checkpoint, state)
+
+    last_checkpoint = now()
+    while now() - start <= timeout and best.quality > lower_bound:
+        r: Optional[Evaluated] = None
+        for _ in range(num_of_tweaks + 1):
             if now() - start > timeout:
                 break
-            w = tweak(deepcopy(s))
-            if not tabu.contains(w) and (tabu.contains(r) or quality(w) < quality(r)):
-                r = w
-        if not tabu.contains(r):
+            undo = tweak(s.solution)
+            if not tabu.contains(s.solution):
+                w = evaluate(s.solution)
+                if r is None or w.quality < evaluate.cached(r):
+                    r = w._replace(solution=list(w.solution))
+            undo()
+        if r is not None:
             s = r
-            tabu.push(r)
-        if quality(s) < quality(best):
-            print(f"new best! {quality(s)} - after {now() - start} s.", file=sys.stderr)
+            tabu.push(r.solution)
+        if evaluate.cached(s) < evaluate.cached(best):
+            print(f"new best! {s.quality} - after {now() - start} s.", file=sys.stderr)
             best = s
-    return best, quality(best)
+        if checkpoint is not None and now() - last_checkpoint >= checkpoint_interval:
+            save()
+            last_checkpoint = now()
+    if checkpoint is not None:
+        save()
+    print(evaluate, file=sys.stderr)
+    return best.solution, evaluate.cached(best)
 
 
 def main():
     t, n, m = map(int, input().split())
     maze = Maze([input() for _ in range(n)])
+    # an optional argument names a checkpoint file, resumed from when it exists
+    checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
 
     path, cost = tabu_search(
         initial=maze.init_path(),
@@ -162,6 +410,10 @@ def main():
         tabu_size=n * 10,
         num_of_tweaks=n * m,
         timeout=float(t),
+        lower_bound=maze.lower_bound(),
+        key=maze.fingerprint,
+        checkpoint=checkpoint,
+        resume_from=resume_from,
     )
 
     print(cost)
@@ -1,6 +1,11 @@
+import multiprocessing
+import os
 import random
 import sys
-from typing import Callable, List, Tuple, Union
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 
 import metaheuristics as meta
 
@@ -8,8 +13,33 @@ Matrix = List[List[int]]
 
 VALUES = [0, 32, 64, 128, 160, 192, 223, 255]
 
+Rect = Tuple[int, int, int, int]  # row, column, height, width
+
+# sides of blocks, indexed by their kind, line and the start and length of their span
+Side = Tuple[int, int, int, int]
+LEFT, RIGHT, TOP, BOTTOM = range(4)
+
+# random blocks tried by merge_then_split before scanning for a block it can split
+BIG_BLOCK_TRIES = 8
+
+# images with at least this many pixels are split into tiles on several cores
+LARGE_AREA = 100 * 100
+# images and tiles with both sides at least this long are solved coarse to fine,
+# shorter ones give the pyramid too few levels to beat a flat run
+PYRAMID_SIDE = 256
+# nor does it with less than a second for this many pixels, which leaves the coarse levels too little time
+PYRAMID_RATE = 10000
+# the coarsest level of the pyramid has at least this many pixels
+PYRAMID_AREA = 32 * 32
+# share of the time limit spent annealing the stitched tiles together
+POLISH_SHARE = 0.2
+# acceptance of worsening tweaks when polishing an already annealed layout
+POLISH_ACCEPTANCE = 0.1
+
 
 class Block:
+    __slots__ = ("row", "column", "height", "width", "value")
+
     def __init__(self, row, column, height, width, value):
         self.row: int = row
         self.column: int = column
@@ -19,19 +49,128 @@ class Block:
 
 
 class BlockMatrix:
-    def __init__(self, blocks, height, width):
-        self.blocks: List[Block] = blocks
+    """
+    Blocks covering the matrix, kept field by field in arrays and referred to by their index,
+    so copying a block matrix is a few memory copies.
+    An index of block sides finds the blocks sharing a whole side with a block,
+    and a raster of block indices, rebuilt after the layout changes, gives the value of a pixel.
+    """
+
+    def __init__(self, blocks: List[Block], height, width):
         self.height: int = height
         self.width: int = width
+        self.rows = array("i", [block.row for block in blocks])
+        self.columns = array("i", [block.column for block in blocks])
+        self.heights = array("i", [block.height for block in blocks])
+        self.widths = array("i", [block.width for block in blocks])
+        self.values = array("i", [block.value for block in blocks])
+        self.errors = array("q", [0] * len(blocks))
+        self.sides: Dict[Side, int] = {side: i for i in range(len(blocks)) for side in self._sides(i)}
+        self.pixel_sums: Optional[PixelSums] = None
+        self.error: int = 0
+        self._labels: Optional[array] = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def rect(self, i: int) -> Rect:
+        return self.rows[i], self.columns[i], self.heights[i], self.widths[i]
+
+    def _sides(self, i: int) -> Tuple[Side, ...]:
+        row, column, height, width = self.rect(i)
+        return (
+            (LEFT, column, row, height),
+            (RIGHT, column + width, row, height),
+            (TOP, row, column, width),
+            (BOTTOM, row + height, column, width),
+        )
+
+    def neighbours(self, i: int) -> List[int]:
+        """
+        Blocks sharing a whole side with the block i.
+        """
+        row, column, height, width = self.rect(i)
+        sides = (
+            (LEFT, column + width, row, height),
+            (RIGHT, column, row, height),
+            (TOP, row + height, column, width),
+            (BOTTOM, row, column, width),
+        )
+        return [self.sides[side] for side in sides if side in self.sides]
+
+    def reshape(self, rects: Dict[int, Rect]) -> None:
+        """
+        Moves the given blocks to new rectangles, which have to cover the same area together.
+        """
+        for i in rects:
+            for side in self._sides(i):
+                if self.sides.get(side) == i:
+                    del self.sides[side]
+        for i, (row, column, height, width) in rects.items():
+            self.rows[i], self.columns[i], self.heights[i], self.widths[i] = row, column, height, width
+        for i in rects:
+            for side in self._sides(i):
+                self.sides[side] = i
+        self._labels = None
+
+    def track(self, pixel_sums: "PixelSums") -> "BlockMatrix":
+        """
+        Starts keeping the squared error of every block against the matrix of pixel_sums,
+        and their total, so changed blocks are rescored with update.
+        """
+        self.pixel_sums = pixel_sums
+        self.error = 0
+        for i in range(len(self)):
+            self.errors[i] = pixel_sums.error(self.rect(i), self.values[i])
+            self.error += self.errors[i]
+        return self
+
+    def update(self, i: int) -> None:
+        if self.pixel_sums is not None:
+            error = self.pixel_sums.error(self.rect(i), self.values[i])
+            self.error += error - self.errors[i]
+            self.errors[i] = error
+
+    def __getstate__(self):
+        """
+        Pickles only the arrays of the layout, so checkpoints stay small.
+        The side index is rebuilt from them, the raster when it is needed, and the pixel sums
+        come from the matrix: call track again on an unpickled block matrix to rescore its blocks.
+        """
+        state = self.__dict__.copy()
+        state["pixel_sums"], state["_labels"] = None, None
+        del state["sides"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.sides = {side: i for i in range(len(self)) for side in self._sides(i)}
+
+    def copy(self) -> "BlockMatrix":
+        bm = BlockMatrix([], self.height, self.width)
+        bm.rows, bm.columns, bm.heights, bm.widths = self.rows[:], self.columns[:], self.heights[:], self.widths[:]
+        bm.values, bm.errors = self.values[:], self.errors[:]
+        bm.sides = self.sides.copy()
+        bm.pixel_sums, bm.error = self.pixel_sums, self.error
+        bm._labels = self._labels  # replaced, never changed in place
+        return bm
+
+    def _rasterize(self) -> array:
+        labels = array("i", [-1]) * (self.height * self.width)
+        for i in range(len(self)):
+            row, column, height, width = self.rect(i)
+            line = array("i", [i]) * width
+            for r in range(row, row + height):
+                labels[r * self.width + column : r * self.width + column + width] = line
+        return labels
 
     def __getitem__(self, pos):
         row, column = pos
-        for block in self.blocks:
-            if row in range(block.row, block.row + block.height) and column in range(
-                block.column, block.column + block.width
-            ):
-                return block.value
-        raise IndexError
+        if row not in range(self.height) or column not in range(self.width):
+            raise IndexError
+        if self._labels is None:
+            self._labels = self._rasterize()
+        return self.values[self._labels[row * self.width + column]]
 
     def __str__(self):
         return self.to_str()
@@ -46,18 +185,77 @@ class BlockMatrix:
         return result
 
 
+class PixelSums:
+    """
+    Summed-area tables of a matrix and of its squares,
+    giving the sums over any rectangle in four lookups.
+    """
+
+    def __init__(self, M: Matrix, n, m):
+        self.sums: List[List[int]] = [[0] * (m + 1) for _ in range(n + 1)]
+        self.squares: List[List[int]] = [[0] * (m + 1) for _ in range(n + 1)]
+        for i in range(n):
+            row_sum = row_squares = 0
+            for j in range(m):
+                row_sum += M[i][j]
+                row_squares += M[i][j] ** 2
+                self.sums[i + 1][j + 1] = self.sums[i][j + 1] + row_sum
+                self.squares[i + 1][j + 1] = self.squares[i][j + 1] + row_squares
+
+    @staticmethod
+    def _rectangle(table: List[List[int]], rect: Rect) -> int:
+        top, left, height, width = rect
+        bottom, right = top + height, left + width
+        return table[bottom][right] - table[top][right] - table[bottom][left] + table[top][left]
+
+    def error(self, rect: Rect, value: int) -> int:
+        """
+        Sum of squared differences between the rectangle of the matrix and the value.
+        """
+        area = rect[2] * rect[3]
+        return self._rectangle(self.squares, rect) - 2 * value * self._rectangle(self.sums, rect) + value ** 2 * area
+
+    def best_value(self, rect: Rect) -> int:
+        """
+        The value minimising the error of the rectangle, the one nearest to the mean of its area.
+        """
+        mean = self._rectangle(self.sums, rect) / (rect[2] * rect[3])
+        return min(VALUES, key=lambda value: abs(value - mean))
+
+
 def mse_distance(M1: Matrix, n, m) -> Callable[[BlockMatrix], float]:
+    """
+    Mean squared error computed per block from summed-area tables, in time linear in the number of blocks.
+    The blocks have to cover the matrix without overlapping, as every tweak keeps them.
+    A block matrix tracking its errors against M1 is scored in constant time.
+    """
+    pixel_sums = PixelSums(M1, n, m)
+
     def quality(M2: BlockMatrix) -> float:
-        return sum(sum((M1[i][j] - M2[i, j]) ** 2 for j in range(m)) for i in range(n)) / (n * m)
+        if M2.pixel_sums is not None:
+            return M2.error / (n * m)
+        return sum(pixel_sums.error(M2.rect(i), M2.values[i]) for i in range(len(M2))) / (n * m)
 
     return quality
 
 
-def tweak_factory(k: int) -> Callable[[BlockMatrix], BlockMatrix]:
-    def intensity_disruption(bm: BlockMatrix) -> BlockMatrix:
-        block = random.choice(bm.blocks)
-        block.value = random.choice(VALUES)
-        return bm
+def fit_values(bm: BlockMatrix, pixel_sums: PixelSums) -> BlockMatrix:
+    for i in range(len(bm)):
+        bm.values[i] = pixel_sums.best_value(bm.rect(i))
+    return bm
+
+
+def tweak_factory(k: int) -> Callable[[BlockMatrix], meta.Undo]:
+    """
+    Tweaks change the block matrix in place, rescore the blocks they touched
+    and return a function restoring those blocks.
+    Every technique passes the indices of the blocks to remember before changing them.
+    """
+
+    def intensity_disruption(bm: BlockMatrix, remember: Callable[..., None]) -> None:
+        i = random.randrange(len(bm))
+        remember(i)
+        bm.values[i] = random.choice(VALUES)
 
     def split(value) -> Tuple[int, int]:
         v1 = v2 = k
@@ -70,67 +268,71 @@ def tweak_factory(k: int) -> Callable[[BlockMatrix], BlockMatrix]:
             rest -= 1
         return v1, v2
 
-    def merge_then_split(bm: BlockMatrix) -> BlockMatrix:
-        try:
-            big_block = random.choice([b for b in bm.blocks if b.height > k or b.width > k])
-        except IndexError:
-            return intensity_disruption(bm)
-
-        neighbor: Union[Block, None] = None
-        direction: Union[str, None] = None
-
-        for b in bm.blocks:
-            if b is big_block:
-                continue
-
-            if (
-                b.row == big_block.row
-                and b.height == big_block.height
-                and (b.column + b.width == big_block.column or big_block.column + big_block.width == b.column)
-            ):
-                neighbor, direction = b, "horizontal"
-                break
-
-            if (
-                b.column == big_block.column
-                and b.width == big_block.width
-                and (b.row + b.height == big_block.row or big_block.row + big_block.height == b.row)
-            ):
-                neighbor, direction = b, "vertical"
-                break
-
-        if neighbor:
-            if direction == "horizontal":
-                w1, w2 = split(big_block.width + neighbor.width)
-
-                neighbor.column = min(big_block.column, neighbor.column)
-                neighbor.width = w1
-
-                big_block.column = neighbor.column + w1
-                big_block.width = w2
+    def big_block(bm: BlockMatrix) -> Optional[int]:
+        """
+        A random block higher or wider than k.
+        A few random blocks are tried before all of them are scanned.
+        """
+        for _ in range(BIG_BLOCK_TRIES):
+            i = random.randrange(len(bm))
+            if bm.heights[i] > k or bm.widths[i] > k:
+                return i
+        big = [i for i in range(len(bm)) if bm.heights[i] > k or bm.widths[i] > k]
+        return random.choice(big) if big else None
+
+    def merge_then_split(bm: BlockMatrix, remember: Callable[..., None]) -> None:
+        i = big_block(bm)
+        if i is None:
+            return intensity_disruption(bm, remember)
+
+        neighbours = bm.neighbours(i)
+        if neighbours:
+            j = random.choice(neighbours)
+            remember(i, j)
+            row, column, height, width = bm.rect(i)
+            neighbour_row, neighbour_column, neighbour_height, neighbour_width = bm.rect(j)
+            if neighbour_row == row and neighbour_height == height:
+                w1, w2 = split(width + neighbour_width)
+                left = min(column, neighbour_column)
+                bm.reshape({j: (row, left, height, w1), i: (row, left + w1, height, w2)})
             else:
-                h1, h2 = split(big_block.height + neighbor.height)
-
-                neighbor.row = min(big_block.row, neighbor.row)
-                neighbor.height = h1
-
-                big_block.row = neighbor.row + h1
-                big_block.height = h2
+                h1, h2 = split(height + neighbour_height)
+                top = min(row, neighbour_row)
+                bm.reshape({j: (top, column, h1, width), i: (top + h1, column, h2, width)})
         else:
-            big_block.value = random.choice(VALUES)
+            remember(i)
+            bm.values[i] = random.choice(VALUES)
+
+    def block_swap(bm: BlockMatrix, remember: Callable[..., None]) -> None:
+        if len(bm) < 2:
+            return intensity_disruption(bm, remember)
+        i = random.randrange(len(bm))
+        j = random.randrange(len(bm) - 1)
+        if j >= i:
+            j += 1
+        remember(i, j)
+        bm.values[i], bm.values[j] = bm.values[j], bm.values[i]
+
+    def tweak(bm: BlockMatrix) -> meta.Undo:
+        tweak_technique = random.choice([intensity_disruption, merge_then_split, block_swap])
 
-        return bm
+        saved = []
 
-    def block_swap(bm: BlockMatrix) -> BlockMatrix:
-        b1 = random.choice(bm.blocks)
-        b2 = random.choice([b for b in bm.blocks if b is not b1])
-        b1.value, b2.value = b2.value, b1.value
-        return bm
+        def remember(*blocks: int) -> None:
+            saved.extend((i, bm.rect(i), bm.values[i], bm.errors[i]) for i in blocks)
 
-    def tweak(bm: BlockMatrix):
-        tweak_technique = random.choice([intensity_disruption, merge_then_split, block_swap])
+        tweak_technique(bm, remember)
+        for i, *_ in saved:
+            bm.update(i)
+
+        def undo():
+            if any(bm.rect(i) != rect for i, rect, _, _ in saved):
+                bm.reshape({i: rect for i, rect, _, _ in saved})
+            for i, _, value, error in saved:
+                bm.error += error - bm.errors[i]
+                bm.values[i], bm.errors[i] = value, error
 
-        return tweak_technique(bm)
+        return undo
 
     return tweak
 
@@ -165,21 +367,259 @@ def zeros(n, m) -> BlockMatrix:
     return BlockMatrix(blocks=[Block(0, 0, n, m, 0)], height=n, width=m)
 
 
+def anneal(
+    matrix: Matrix,
+    n,
+    m,
+    k,
+    timeout: float,
+    initial_solution: Optional[BlockMatrix] = None,
+    acceptance: float = 0.8,
+    checkpoint: Optional[str] = None,
+    resume_from: Optional[str] = None,
+) -> Tuple[BlockMatrix, float]:
+    """
+    Simulated annealing of a block matrix from the layout of initial_solution, by default a random one,
+    with values fitted to the matrix, the temperature calibrated for the acceptance of worsening tweaks
+    and cooling towards the timeout.
+    A search resumed from a checkpoint continues from the saved layouts, tracked against the matrix again.
+    """
+    quality = mse_distance(matrix, n, m)
+    tweak = tweak_factory(k)
+    pixel_sums = PixelSums(matrix, n, m)
+    temperature = 0.0
+    if resume_from is None:
+        if initial_solution is None:
+            initial_solution = random_block_matrix(n, m, k + 1)
+        fit_values(initial_solution, pixel_sums).track(pixel_sums)
+        temperature = meta.calibrate_temperature(quality, initial_solution, tweak, acceptance=acceptance, in_place=True)
+
+    return meta.simulated_annealing(
+        function=quality,
+        initial_solution=initial_solution,
+        initial_temperature=temperature,
+        cooling_schedule=meta.deadline_schedule(timeout),
+        tweak=tweak,
+        timeout=timeout,
+        in_place=True,
+        snapshot=BlockMatrix.copy,
+        checkpoint=checkpoint,
+        resume_from=resume_from,
+        restore=lambda bm: bm.track(pixel_sums),
+    )
+
+
+def tiles(n, m, size, parts) -> List[Rect]:
+    """
+    Splits the matrix into at most parts strips of whole rows of size x size blocks,
+    the last strip taking the rows left over, as the last row of random_block_matrix does.
+    """
+    block_rows = n // size
+    parts = max(1, min(parts, block_rows))
+    bounds = [block_rows * p // parts * size for p in range(parts)] + [n]
+    return [(top, 0, bottom - top, m) for top, bottom in zip(bounds, bounds[1:])]
+
+
+_tile_matrix: Matrix = []
+
+
+def _init_tiles(matrix: Matrix) -> None:
+    global _tile_matrix
+    _tile_matrix = matrix
+
+
+def _anneal_tile(
+    seed: int, tile: Rect, k, deadline: float, checkpoint: Optional[str]
+) -> List[Tuple[int, int, int, int, int]]:
+    """
+    Solves one tile of the matrix in a worker process, resuming from its checkpoint when it exists.
+    Returns its blocks as (row, column, height, width, value) in the coordinates of the whole matrix.
+    """
+    random.seed(seed)
+    top, left, height, width = tile
+    part = [row[left : left + width] for row in _tile_matrix[top : top + height]]
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
+    bm, _ = solve(part, height, width, k, deadline - time.time(), checkpoint=checkpoint, resume_from=resume_from)
+    return [
+        (top + bm.rows[i], left + bm.columns[i], bm.heights[i], bm.widths[i], bm.values[i]) for i in range(len(bm))
+    ]
+
+
+def tile_parallel_annealing(
+    matrix: Matrix,
+    n,
+    m,
+    k,
+    timeout: float,
+    workers: int,
+    polish_share: float = POLISH_SHARE,
+    checkpoint: Optional[str] = None,
+    resume_from: Optional[str] = None,
+) -> Tuple[BlockMatrix, float]:
+    """
+    Solves strips of the matrix aligned to the grid of random_block_matrix in worker processes,
+    stitches their blocks into one layout and anneals it as a whole for polish_share of the time,
+    so blocks along the seams can still be merged and split.
+    The workers are forked, so they read the matrix from memory shared with the parent.
+
+    With checkpoint, the polish is checkpointed to that file and every tile to that file suffixed
+    with its index. resume_from continues the polish, skipping the tiles. Without it,
+    tiles with a checkpoint continue from it, which holds for the same number of workers.
+    """
+    if resume_from is not None:
+        return anneal(matrix, n, m, k, timeout * polish_share, checkpoint=checkpoint, resume_from=resume_from)
+
+    deadline = time.time() + timeout * (1 - polish_share)
+    parts = tiles(n, m, k + 1, workers)
+    seeds = [random.randrange(2 ** 32) for _ in parts]
+    checkpoints = [None if checkpoint is None else f"{checkpoint}.{index}" for index in range(len(parts))]
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_tiles, initargs=(matrix,)) as executor:
+        futures = [
+            executor.submit(_anneal_tile, seed, tile, k, deadline, tile_checkpoint)
+            for seed, tile, tile_checkpoint in zip(seeds, parts, checkpoints)
+        ]
+        blocks = [Block(*block) for future in futures for block in future.result()]
+
+    stitched = BlockMatrix(blocks, n, m)
+    return anneal(
+        matrix,
+        n,
+        m,
+        k,
+        timeout * polish_share,
+        initial_solution=stitched,
+        acceptance=POLISH_ACCEPTANCE,
+        checkpoint=checkpoint,
+    )
+
+
+def mean_pool(M: Matrix, n, m) -> Matrix:
+    """
+    Matrix of the rounded means of 2 x 2 squares of M, of size n // 2 x m // 2.
+    The last row and column take the pixels left over from an odd size.
+    """
+    row_bounds = [2 * i for i in range(n // 2)] + [n]
+    column_bounds = [2 * j for j in range(m // 2)] + [m]
+    return [
+        [
+            round(
+                sum(M[r][c] for r in range(top, bottom) for c in range(left, right))
+                / ((bottom - top) * (right - left))
+            )
+            for left, right in zip(column_bounds, column_bounds[1:])
+        ]
+        for top, bottom in zip(row_bounds, row_bounds[1:])
+    ]
+
+
+def upscale(bm: BlockMatrix, n, m) -> BlockMatrix:
+    """
+    Layout of bm, made for the mean_pool of an n x m matrix, scaled up to that matrix.
+    Blocks along the last row and column stretch to its edges.
+    """
+    blocks = []
+    for i in range(len(bm)):
+        row, column, height, width = bm.rect(i)
+        bottom = n if row + height == bm.height else 2 * (row + height)
+        right = m if column + width == bm.width else 2 * (column + width)
+        blocks.append(Block(2 * row, 2 * column, bottom - 2 * row, right - 2 * column, bm.values[i]))
+    return BlockMatrix(blocks, n, m)
+
+
+def pyramid_annealing(
+    matrix: Matrix, n, m, k, timeout: float, checkpoint: Optional[str] = None, resume_from: Optional[str] = None
+) -> Tuple[BlockMatrix, float]:
+    """
+    Anneals mean-pooled versions of the matrix from the coarsest one,
+    with blocks at least ceil(k / 2) at every halving of the size,
+    and starts every finer level from the layout of the coarser one scaled up.
+    The coarsest layout starts with blocks of half the size, rounded down, at every level,
+    so scaled up they are no larger than a flat run's unless the size floor rounds them up.
+    Every level gets a share of the time proportional to its number of pixels.
+
+    With checkpoint, every level is checkpointed to that file in turn.
+    resume_from continues the level whose size the saved layout has, skipping the coarser ones.
+    """
+    levels = [(matrix, n, m, k)]
+    block_size = k + 1
+    while True:
+        M, height, width, size = levels[-1]
+        coarse_height, coarse_width, coarse_size = height // 2, width // 2, (size + 1) // 2
+        if coarse_height * coarse_width < PYRAMID_AREA or min(coarse_height, coarse_width) <= coarse_size:
+            break
+        levels.append((mean_pool(M, height, width), coarse_height, coarse_width, coarse_size))
+        block_size = max(block_size // 2, coarse_size)
+
+    first = len(levels) - 1
+    if resume_from is not None:
+        saved, _ = meta.load_checkpoint(resume_from)["best"]
+        first = [(height, width) for _, height, width, _ in levels].index((saved.height, saved.width))
+
+    total = sum(height * width for _, height, width, _ in levels)
+    solution: Optional[BlockMatrix] = None
+    for level in reversed(range(first + 1)):
+        M, height, width, size = levels[level]
+        share = timeout * height * width / total
+        if level == first and resume_from is not None:
+            solution, result = anneal(M, height, width, size, share, checkpoint=checkpoint, resume_from=resume_from)
+        elif solution is None:
+            initial_solution = random_block_matrix(height, width, block_size)
+            solution, result = anneal(M, height, width, size, share, initial_solution, checkpoint=checkpoint)
+        else:
+            initial_solution = upscale(solution, height, width)
+            solution, result = anneal(
+                M, height, width, size, share, initial_solution, acceptance=POLISH_ACCEPTANCE, checkpoint=checkpoint
+            )
+    return solution, result
+
+
+def solve(
+    matrix: Matrix, n, m, k, timeout: float, checkpoint: Optional[str] = None, resume_from: Optional[str] = None
+) -> Tuple[BlockMatrix, float]:
+    """
+    Solves the matrix in one process, coarse to fine when both its sides are at least PYRAMID_SIDE
+    and there is a second for at most PYRAMID_RATE pixels.
+    """
+    if min(n, m) >= PYRAMID_SIDE and n * m <= PYRAMID_RATE * timeout:
+        return pyramid_annealing(matrix, n, m, k, timeout, checkpoint=checkpoint, resume_from=resume_from)
+    return anneal(matrix, n, m, k, timeout, checkpoint=checkpoint, resume_from=resume_from)
+
+
 def main():
     _input = input().split()
     t = float(_input[0])
     n, m, k = map(int, _input[1:])
     matrix = [list(map(int, input().split())) for _ in range(n)]
-
-    best_solution, best_result = meta.simulated_annealing(
-        function=mse_distance(matrix, n, m),
-        initial_solution=random_block_matrix(n, m, k + 1),
-        initial_temperature=1.52,
-        cooling_schedule=lambda t, _: t * 0.85,
-        tweak=tweak_factory(k),
-        timeout=t,
-        deep_input=True,
-    )
+    # an optional argument names a checkpoint file, resumed from when it exists
+    checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
+
+    cores = os.cpu_count() or 1
+    if cores > 1 and n * m >= LARGE_AREA:
+        best_solution, best_result = tile_parallel_annealing(
+            matrix, n, m, k, t, cores, checkpoint=checkpoint, resume_from=resume_from
+        )
+    elif cores > 1:
+        pixel_sums = PixelSums(matrix, n, m)
+        initial_solution = fit_values(random_block_matrix(n, m, k + 1), pixel_sums).track(pixel_sums)
+        quality = mse_distance(matrix, n, m)
+        tweak = tweak_factory(k)
+        temperature = meta.calibrate_temperature(quality, initial_solution, tweak, in_place=True)
+        best_solution, best_result = meta.parallel_tempering(
+            function=quality,
+            initial_solution=initial_solution,
+            temperatures=meta.geometric_temperatures(temperature * meta.FINAL_RATIO, temperature, cores),
+            tweak=tweak,
+            timeout=t,
+            in_place=True,
+            snapshot=BlockMatrix.copy,
+            checkpoint=checkpoint,
+            resume_from=resume_from,
+            restore=lambda bm: bm.track(pixel_sums),
+        )
+    else:
+        best_solution, best_result = solve(matrix, n, m, k, t, checkpoint=checkpoint, resume_from=resume_from)
 
     # print(mse_distance(matrix, random_block_matrix(n, m, k)))
     # print(mse_distance(matrix, zeros(n, m)))
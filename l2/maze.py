@@ -1,9 +1,13 @@
+import os
 import random
 import sys
+from array import array
+from collections import deque
 from enum import Enum
 from typing import List, Tuple
 
 import metaheuristics as meta
+from seeds import EXIT_CELL, seed_walks
 
 
 class Move(Enum):
@@ -22,6 +26,18 @@ class Field(Enum):
 
 Path = List[Tuple[int, int]]
 
+MOVES = [move.value for move in Move]
+MOVE_INDEX = {move: index for index, move in enumerate(MOVES)}
+
+# transition target of the moves leaving the maze
+OUTSIDE = -2
+
+# mazes with more fields get only a bound on the shortest path
+EXACT_LIMIT = 10 ** 6
+
+# time limit of generating seed paths
+SEED_TIMEOUT = 1.0
+
 
 def tuple_sum(t1: tuple, t2: tuple):
     return tuple(sum(t) for t in zip(t1, t2))
@@ -35,6 +51,29 @@ class Maze:
         )
         self.size = len(maze_map) * len(maze_map[0])
         self.n, self.m = len(maze_map), len(maze_map[0])
+        self.start_cell = self.start[0] * self.m + self.start[1]
+        self.transitions = self.compile()
+
+    def compile(self) -> array:
+        """
+        Builds the table of the cell reached by every move from every cell.
+        The move with index k from cell c leads to transitions[4 * c + k].
+        """
+        transitions = array("i", [0] * (4 * self.size))
+        for x, row in enumerate(self.map):
+            for y in range(len(row)):
+                c = x * self.m + y
+                for k, move in enumerate(MOVES):
+                    nx, ny = tuple_sum((x, y), move)
+                    if nx not in range(self.n) or ny not in range(self.m):
+                        transitions[4 * c + k] = OUTSIDE
+                    elif self.map[nx][ny] == Field.EXIT.value:
+                        transitions[4 * c + k] = EXIT_CELL
+                    elif self.map[nx][ny] == Field.WALL.value:
+                        transitions[4 * c + k] = c
+                    else:
+                        transitions[4 * c + k] = nx * self.m + ny
+        return transitions
 
     def path_cost(self, path: Path) -> int:
         pos = self.start
@@ -57,58 +96,131 @@ class Maze:
 
         return cost
 
+    def lower_bound(self, exact_limit: int = EXACT_LIMIT) -> int:
+        """
+        Length of the shortest path to the exit, found by breadth-first search.
+        Mazes with more than exact_limit fields get the Manhattan distance
+        to the nearest exit instead. Returns 0 when there is no exit to reach.
+        """
+        exits = [(i, j) for i, row in enumerate(self.map) for j, field in enumerate(row) if field == Field.EXIT.value]
+        if not exits:
+            return 0
+        if self.size > exact_limit:
+            return min(abs(x - self.start[0]) + abs(y - self.start[1]) for x, y in exits)
+
+        distance = {self.start: 0}
+        queue = deque([self.start])
+        while queue:
+            pos = queue.popleft()
+            for move in Move:
+                x, y = tuple_sum(pos, move.value)
+                if x not in range(self.n) or y not in range(self.m) or (x, y) in distance:
+                    continue
+                if self.map[x][y] == Field.EXIT.value:
+                    return distance[pos] + 1
+                if self.map[x][y] != Field.WALL.value:
+                    distance[x, y] = distance[pos] + 1
+                    queue.append((x, y))
+        return 0
+
+    def compact_path(self, path: Path) -> None:
+        """
+        Shortens a path reaching the exit in place: drops moves into walls,
+        cuts the loops between visits of the same cell and the moves after the exit.
+        Paths not reaching the exit are left as they are.
+        """
+        transitions = self.transitions
+        cells = [self.start_cell]
+        position = {self.start_cell: 0}
+        moves: Path = []
+        for move in path:
+            target = transitions[4 * cells[-1] + MOVE_INDEX[move]]
+            if target == EXIT_CELL:
+                moves.append(move)
+                path[:] = moves
+                return
+            if target < 0:
+                return
+            if target in position:
+                back = position[target]
+                for cell in cells[back + 1 :]:
+                    del position[cell]
+                del cells[back + 1 :]
+                del moves[back:]
+            else:
+                position[target] = len(cells)
+                cells.append(target)
+                moves.append(move)
+
     @staticmethod
-    def tweak_path(path) -> Path:
+    def tweak_path(path: Path) -> meta.Undo:
+        """
+        Swaps two moves or reverses a segment of the path in place.
+        Both are undone by applying them again.
+        """
+        if len(path) < 2:
+            return lambda: None
         if random.random() < 0.6:
             i = random.randrange(len(path))
             j = random.randrange(len(path))
-            path[i], path[j] = path[j], path[i]
-            return path
+
+            def swap():
+                path[i], path[j] = path[j], path[i]
+
+            swap()
+            return swap
         i = random.randrange(len(path) - 1)
-        j = random.choice([c for c in range(len(path)) if c > i])
-        return path[:i] + list(reversed(path[i:j])) + path[j:]
+        j = random.randrange(i + 1, len(path))
+
+        def reverse():
+            path[i:j] = path[i:j][::-1]
+
+        reverse()
+        return reverse
+
+    def seed_paths(self, count: int, timeout: float = SEED_TIMEOUT) -> List[Path]:
+        """
+        Up to count distinct paths reaching the exit: a random shortest path,
+        branches of random search trees and noisy wall followers.
+        """
+        return [[MOVES[k] for k in walk] for walk in seed_walks(self.transitions, self.start_cell, count, timeout)]
 
     def init_path(self) -> Path:
         """
-        creates a path of length no greater than a third of the maze
-        Random walk resests after a third of the maze
+        A random shortest path to the exit, the first of the seed paths.
         """
-        moves = [m.value for m in Move]
-
-        while True:
-            path: Path = []
-            x, y = self.start
-            move = random.choice(moves)
-            while len(path) < self.n * self.m / 3:
-                nx, ny = tuple_sum((x, y), move)
-
-                if nx in range(self.n) and ny in range(self.m):
-                    if self.map[nx][ny] == Field.EXIT.value:
-                        path.append(move)
-                        return path
-                    if self.map[nx][ny] == Field.WALL.value:
-                        move = random.choice(moves)
-                    else:
-                        x, y = nx, ny
-                        path.append(move)
-                        if random.random() < 0.2:
-                            move = random.choice(moves)
-                else:
-                    move = random.choice(moves)
+        paths = self.seed_paths(1)
+        if not paths:
+            raise ValueError("the exit cannot be reached")
+        return paths[0]
 
 
 def main():
     t, n, _ = map(int, input().split())
     maze = Maze([input() for _ in range(n)])
+    # an optional argument names a checkpoint file, resumed from when it exists
+    checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
+
+    initial_path = maze.init_path()
+    # worsening tweaks mostly lose the exit, so they should rarely be accepted
+    temperature = meta.calibrate_temperature(
+        maze.path_cost, initial_path, maze.tweak_path, acceptance=0.1, in_place=True
+    )
 
     path, cost = meta.simulated_annealing(
         function=maze.path_cost,
-        initial_solution=maze.init_path(),
-        initial_temperature=10 ** 5,
-        cooling_schedule=lambda t, _: t * 0.99,
+        initial_solution=initial_path,
+        initial_temperature=temperature,
+        cooling_schedule=meta.deadline_schedule(t),
         tweak=maze.tweak_path,
         timeout=t,
-        deep_input=True,
+        in_place=True,
+        snapshot=list,
+        compact=maze.compact_path,
+        lower_bound=maze.lower_bound(),
+        checkpoint=checkpoint,
+        resume_from=resume_from,
     )
 
     print(cost)
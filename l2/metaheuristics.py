@@ -1,8 +1,12 @@
+import multiprocessing
+import os
+import pickle
 import time
 from copy import deepcopy
-from math import exp
-from random import random
-from typing import Callable, Tuple, TypeVar
+from math import exp, inf, log
+from multiprocessing.connection import Connection
+from random import getstate, random, seed, setstate
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar, Union
 
 
 def now() -> float:
@@ -10,6 +14,32 @@ def now() -> float:
 
 
 T = TypeVar("T")
+Undo = Callable[[], None]
+Schedule = Callable[[float, int], float]
+
+# temperature at the deadline relative to the initial one
+FINAL_RATIO = 1e-3
+
+# seconds between checkpoints of a search state
+CHECKPOINT_INTERVAL = 60.0
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """
+    Writes the state of a search to path atomically:
+    to a temporary file first, which then replaces the previous checkpoint.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as file:
+        return pickle.load(file)
 
 
 def simulated_annealing(
@@ -20,6 +50,14 @@ def simulated_annealing(
     tweak: Callable[[T], T],
     timeout: float,
     deep_input=False,
+    in_place=False,
+    snapshot: Callable[[T], T] = deepcopy,
+    lower_bound: float = -inf,
+    compact: Optional[Callable[[T], None]] = None,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    resume_from: Optional[str] = None,
+    restore: Optional[Callable[[T], None]] = None,
 ) -> Tuple[T, float]:
     """
     Returns a minimum of a given function via simulated annealing.
@@ -32,32 +70,429 @@ def simulated_annealing(
         tweak - solution tweak function
         timeout - algorithm timeout in seconds
         deep_input - whether to use deepcopy at tweak
+        in_place - whether tweak changes the solution in place and returns a function undoing it,
+            used instead of deep_input to roll back rejected tweaks without copying
+        snapshot - function copying the solution when it becomes the best one, used with in_place
+        lower_bound - known minimum of the function, stops the search once reached
+        compact - function simplifying the initial and every accepted solution in place
+        checkpoint - file the state of the search is saved to every checkpoint_interval seconds
+            and at the end, together with the state of the random generator
+        resume_from - checkpoint file to continue a search from, instead of initial_solution
+            and initial_temperature; the time already spent counts towards the timeout
+        restore - function called on every solution loaded from a checkpoint, to rebuild
+            what the solutions leave out of it
 
     Returns:
         Best solution found in a given time, function value in that solution
     """
-    temperature = initial_temperature
-    current_solution = initial_solution
-    best_solution = current_solution
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        current_solution, current_result = state["current"]
+        best_solution, best_result = state["best"]
+        if restore is not None:
+            restore(current_solution)
+            restore(best_solution)
+        temperature, i = state["temperature"], state["iteration"]
+        setstate(state["random"])
+        start = now() - state["elapsed"]
+    else:
+        temperature = initial_temperature
+        current_solution = initial_solution
+        if compact is not None:
+            compact(current_solution)
+        best_solution = snapshot(current_solution) if in_place else current_solution
+
+        current_result = function(current_solution)
+        best_result = current_result
 
-    current_result = function(current_solution)
-    best_result = current_result
+        start = now()
+        i = 1
 
-    start = now()
-    i = 1
-    while now() - start <= timeout and temperature > 0:
-        tweaked_solution = tweak(deepcopy(current_solution) if deep_input else current_solution)
+    def save():
+        state = {
+            "current": (current_solution, current_result),
+            "best": (best_solution, best_result),
+            "temperature": temperature,
+            "iteration": i,
+            "random": getstate(),
+            "elapsed": now() - start,
+        }
+        save_checkpoint(checkpoint, state)
+
+    last_checkpoint = now()
+    while now() - start <= timeout and temperature > 0 and best_result > lower_bound:
+        if in_place:
+            undo = tweak(current_solution)
+            tweaked_solution = current_solution
+        else:
+            tweaked_solution = tweak(deepcopy(current_solution) if deep_input else current_solution)
         tweaked_result = function(tweaked_solution)
 
         if tweaked_result <= current_result or (random() < exp((current_result - tweaked_result) / temperature)):
             current_solution = tweaked_solution
             current_result = tweaked_result
+            if compact is not None:
+                compact(current_solution)
+                current_result = function(current_solution)
 
             if current_result <= best_result:
-                best_solution = current_solution
+                best_solution = snapshot(current_solution) if in_place else current_solution
                 best_result = current_result
+        elif in_place:
+            undo()
 
         temperature = cooling_schedule(temperature, i)
         i += 1
 
+        if checkpoint is not None and now() - last_checkpoint >= checkpoint_interval:
+            save()
+            last_checkpoint = now()
+
+    if checkpoint is not None:
+        save()
+    return best_solution, best_result
+
+
+def calibrate_temperature(
+    function: Callable[[T], float],
+    solution: T,
+    tweak: Callable[[T], T],
+    acceptance: float = 0.8,
+    samples: int = 100,
+    deep_input=False,
+    in_place=False,
+) -> float:
+    """
+    Temperature at which simulated annealing accepts a worsening tweak of the solution
+    with the given probability, for the mean worsening of sampled tweaks.
+    The solution is left unchanged. Returns 1 when no sampled tweak is worse.
+    """
+    result = function(solution)
+    worsening = []
+    for _ in range(samples):
+        if in_place:
+            undo = tweak(solution)
+            delta = function(solution) - result
+            undo()
+        else:
+            delta = function(tweak(deepcopy(solution) if deep_input else solution)) - result
+        if delta > 0:
+            worsening.append(delta)
+    if not worsening:
+        return 1.0
+    return sum(worsening) / len(worsening) / -log(acceptance)
+
+
+def deadline_schedule(timeout: float, final_ratio: float = FINAL_RATIO) -> Callable[[float, int], float]:
+    """
+    Cooling schedule falling geometrically with the elapsed time,
+    down to final_ratio of the initial temperature after timeout seconds,
+    so the whole time limit is spent annealing whatever the speed of a step.
+    Every call cools by the time since the previous one, so a resumed search keeps its temperature.
+    """
+    last = now()
+
+    def schedule(temperature: float, _i: int) -> float:
+        nonlocal last
+        current = now()
+        temperature *= final_ratio ** ((current - last) / timeout)
+        last = current
+        return temperature
+
+    return schedule
+
+
+def lockstep_annealing(
+    batch_function: Callable[[List[T]], List[float]],
+    initial_solutions: List[T],
+    temperatures: Sequence[float],
+    cooling_schedule: Union[Schedule, Sequence[Schedule]],
+    batch_tweak: Callable[[List[T]], List[T]],
+    timeout: float,
+    lower_bound: float = -inf,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    resume_from: Optional[str] = None,
+) -> Tuple[T, float]:
+    """
+    Returns a minimum of a given function via simulated annealing of many chains advanced together.
+
+    Every step tweaks and scores the current solutions of all chains with one call each,
+    then every chain accepts or rejects its tweak at its own temperature.
+
+    Parameters:
+        batch_function - function to minimize, taking and returning a list
+        initial_solutions - initial solution of every chain
+        temperatures - initial temperature of every chain
+        cooling_schedule - function for calculating the next temperature of a chain,
+            or one such function per chain for schedules keeping state, like deadline_schedule
+        batch_tweak - function tweaking a list of solutions, returning new solutions
+        timeout - algorithm timeout in seconds
+        lower_bound - known minimum of the function, stops the search once reached
+        checkpoint - file the current solutions and temperatures of the chains and the best solution
+            are saved to every checkpoint_interval seconds and at the end, together with the state
+            of the random generator
+        resume_from - checkpoint file to continue a search from, instead of initial_solutions
+            and temperatures; the time already spent counts towards the timeout
+
+    Returns:
+        Best solution found in a given time, function value in that solution
+    """
+    schedules = [cooling_schedule] * len(temperatures) if callable(cooling_schedule) else list(cooling_schedule)
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        current_solutions, current_results = state["current"]
+        best_solution, best_result = state["best"]
+        temperatures, i = state["temperatures"], state["iteration"]
+        setstate(state["random"])
+        start = now() - state["elapsed"]
+    else:
+        current_solutions = list(initial_solutions)
+        current_results = batch_function(current_solutions)
+        temperatures = list(temperatures)
+        best_result, best_solution = min(zip(current_results, current_solutions), key=lambda pair: pair[0])
+
+        start = now()
+        i = 1
+
+    def save():
+        state = {
+            "current": (current_solutions, current_results),
+            "best": (best_solution, best_result),
+            "temperatures": temperatures,
+            "iteration": i,
+            "random": getstate(),
+            "elapsed": now() - start,
+        }
+        save_checkpoint(checkpoint, state)
+
+    last_checkpoint = now()
+    while now() - start <= timeout and best_result > lower_bound:
+        tweaked_solutions = batch_tweak(current_solutions)
+        tweaked_results = batch_function(tweaked_solutions)
+
+        for c, (current_result, tweaked_result, temperature) in enumerate(
+            zip(current_results, tweaked_results, temperatures)
+        ):
+            if tweaked_result <= current_result or (
+                temperature > 0 and random() < exp((current_result - tweaked_result) / temperature)
+            ):
+                current_solutions[c] = tweaked_solutions[c]
+                current_results[c] = tweaked_result
+
+                if tweaked_result < best_result:
+                    best_solution = tweaked_solutions[c]
+                    best_result = tweaked_result
+
+        temperatures = [schedule(temperature, i) for schedule, temperature in zip(schedules, temperatures)]
+        i += 1
+
+        if checkpoint is not None and now() - last_checkpoint >= checkpoint_interval:
+            save()
+            last_checkpoint = now()
+
+    if checkpoint is not None:
+        save()
+    return best_solution, best_result
+
+
+def geometric_temperatures(lowest: float, highest: float, count: int) -> List[float]:
+    """
+    Ladder of count temperatures from lowest to highest with a constant ratio between neighbours.
+    """
+    if count == 1:
+        return [lowest]
+    ratio = (highest / lowest) ** (1 / (count - 1))
+    return [lowest * ratio ** i for i in range(count)]
+
+
+def _replica(
+    connection: Connection,
+    function: Callable[[T], float],
+    solution: T,
+    best: Optional[Tuple[T, float]],
+    random_state: Any,
+    temperature: float,
+    tweak: Callable[[T], T],
+    swap_interval: int,
+    deadline: float,
+    deep_input: bool,
+    in_place: bool,
+    snapshot: Callable[[T], T],
+) -> None:
+    """
+    Runs the Metropolis steps of one replica in a worker process, starting from best and random_state when given.
+    After every swap_interval steps, or at the deadline, it reports its current and best results
+    and receives its next temperature with whether to send its state, or None when the search is over.
+    Its state is the current solution, the best solution with its result and the state of the random generator.
+    """
+    if random_state is None:
+        seed()  # forked workers would otherwise share the random state
+    else:
+        setstate(random_state)
+    current_result = function(solution)
+    if best is None:
+        best_solution = snapshot(solution) if in_place else solution
+        best_result = current_result
+    else:
+        best_solution, best_result = best
+
+    while True:
+        for _ in range(swap_interval):
+            if now() > deadline:
+                break
+            if in_place:
+                undo = tweak(solution)
+                tweaked_solution = solution
+            else:
+                tweaked_solution = tweak(deepcopy(solution) if deep_input else solution)
+            tweaked_result = function(tweaked_solution)
+
+            if tweaked_result <= current_result or random() < exp((current_result - tweaked_result) / temperature):
+                solution = tweaked_solution
+                current_result = tweaked_result
+
+                if current_result < best_result:
+                    best_solution = snapshot(solution) if in_place else solution
+                    best_result = current_result
+            elif in_place:
+                undo()
+
+        connection.send((current_result, best_result))
+        message = connection.recv()
+        if message is None:
+            break
+        temperature, send_state = message
+        if send_state:
+            connection.send((solution, best_solution, best_result, getstate()))
+
+    connection.send((solution, best_solution, best_result, getstate()))
+
+
+def parallel_tempering(
+    function: Callable[[T], float],
+    initial_solution: T,
+    temperatures: Sequence[float],
+    tweak: Callable[[T], T],
+    timeout: float,
+    swap_interval: int = 100,
+    deep_input=False,
+    in_place=False,
+    snapshot: Callable[[T], T] = deepcopy,
+    lower_bound: float = -inf,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    resume_from: Optional[str] = None,
+    restore: Optional[Callable[[T], None]] = None,
+) -> Tuple[T, float]:
+    """
+    Returns a minimum of a given function via parallel tempering (replica exchange).
+
+    Every temperature gets a replica running in its own process. After every swap_interval steps
+    neighbouring replicas exchange their temperatures with the Metropolis probability
+    of swapping their states, so good solutions found at high temperatures move down the ladder.
+    Only the results travel between the processes, except for checkpoints and the end of the search.
+
+    Parameters:
+        function - function to minimize
+        initial_solution - initial solution of every replica
+        temperatures - ladder of the replica temperatures
+        tweak - solution tweak function
+        timeout - algorithm timeout in seconds
+        swap_interval - number of steps of every replica between the exchanges
+        deep_input, in_place, snapshot, restore - as in simulated_annealing
+        lower_bound - known minimum of the function, stops the search once reached
+        checkpoint - file the states of the replicas, the ladder and the states of the random generators
+            are saved to every checkpoint_interval seconds and at the end
+        resume_from - checkpoint file to continue a search from, instead of initial_solution
+            and temperatures; the time already spent counts towards the timeout
+
+    Returns:
+        Best solution found in a given time, function value in that solution
+    """
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        temperatures, ladder, parity = state["temperatures"], state["ladder"], state["parity"]
+        replicas = state["replicas"]
+        if restore is not None:
+            for solution, best_solution, _, _ in replicas:
+                restore(solution)
+                restore(best_solution)
+        setstate(state["random"])
+        start = now() - state["elapsed"]
+    else:
+        temperatures = sorted(temperatures)
+        ladder = list(range(len(temperatures)))  # replica at every rung of the ladder
+        parity = 0
+        replicas = [(initial_solution, None, None, None)] * len(temperatures)
+        start = now()
+
+    def save(states):
+        state = {
+            "temperatures": temperatures,
+            "ladder": ladder,
+            "parity": parity,
+            "replicas": states,
+            "random": getstate(),
+            "elapsed": now() - start,
+        }
+        save_checkpoint(checkpoint, state)
+
+    context = multiprocessing.get_context("fork")
+    connections = []
+    processes = []
+    rungs = {replica: rung for rung, replica in enumerate(ladder)}
+    for replica, (solution, best_solution, best_result, random_state) in enumerate(replicas):
+        parent_end, child_end = context.Pipe()
+        process = context.Process(
+            target=_replica,
+            args=(
+                child_end,
+                function,
+                solution,
+                None if best_solution is None else (best_solution, best_result),
+                random_state,
+                temperatures[rungs[replica]],
+                tweak,
+                swap_interval,
+                start + timeout,
+                deep_input,
+                in_place,
+                snapshot,
+            ),
+            daemon=True,
+        )
+        process.start()
+        connections.append(parent_end)
+        processes.append(process)
+
+    last_checkpoint = now()
+    while True:
+        reports = [connection.recv() for connection in connections]
+        if now() - start > timeout or min(best for _, best in reports) <= lower_bound:
+            break
+
+        for rung in range(parity, len(ladder) - 1, 2):
+            cold, hot = ladder[rung], ladder[rung + 1]
+            exponent = (1 / temperatures[rung] - 1 / temperatures[rung + 1]) * (reports[cold][0] - reports[hot][0])
+            if exponent >= 0 or random() < exp(exponent):
+                ladder[rung], ladder[rung + 1] = hot, cold
+        parity = 1 - parity
+
+        send_state = checkpoint is not None and now() - last_checkpoint >= checkpoint_interval
+        for rung, replica in enumerate(ladder):
+            connections[replica].send((temperatures[rung], send_state))
+        if send_state:
+            save([connection.recv() for connection in connections])
+            last_checkpoint = now()
+
+    for connection in connections:
+        connection.send(None)
+    states = [connection.recv() for connection in connections]
+    for process in processes:
+        process.join()
+
+    if checkpoint is not None:
+        save(states)
+    _, best_solution, best_result, _ = min(states, key=lambda state: state[2])
     return best_solution, best_result
@@ -1,31 +1,71 @@
-from math import cos, pi, sqrt
+import os
+import sys
+from math import cos, hypot, pi
 from random import gauss
-from typing import Tuple
+from typing import List, Tuple
 
 import metaheuristics as meta
 
 Vector = Tuple[float, ...]
 
+# number of annealing chains advanced together
+CHAINS = 2
+
+# ratio of the starting temperatures of neighbouring chains
+LADDER_RATIO = 0.1
+# acceptance of worsening tweaks the hottest chain starts with, high enough to cross the rings around the optimum
+ACCEPTANCE = 0.999
+# share of the time limit at the end spent at zero temperature,
+# where the tweak keeps shrinking the solutions towards the optimum at 0
+GREEDY_SHARE = 0.5
+
 
 def salomon(xs: Vector) -> float:
-    sqrt_sum = sqrt(sum(x ** 2 for x in xs))
+    sqrt_sum = hypot(*xs)
     return 1 - cos(2 * pi * sqrt_sum) + 0.1 * sqrt_sum
 
 
+def batch_salomon(xss: List[Vector]) -> List[float]:
+    return [1 - cos(2 * pi * r) + 0.1 * r for r in (hypot(*xs) for xs in xss)]
+
+
 def tweak(xs: Vector) -> Vector:
     return tuple(x * gauss(1, 0.1) for x in xs)
 
 
+def batch_tweak(xss: List[Vector]) -> List[Vector]:
+    return [tuple([x * gauss(1, 0.1) for x in xs]) for xs in xss]
+
+
+def cooling_schedule(t: float, temperature: float) -> meta.Schedule:
+    """
+    Cools from temperature down to FINAL_RATIO of it at the end of the annealing share of the time limit,
+    then drops to zero, so the chain accepts only tweaks which do not worsen it.
+    """
+    final = temperature * meta.FINAL_RATIO
+    deadline_schedule = meta.deadline_schedule(t * (1 - GREEDY_SHARE))
+    return lambda temperature, i: deadline_schedule(temperature, i) if temperature > final else 0.0
+
+
 def main():
     t, x1, x2, x3, x4 = map(float, input().split())
+    initial_solution = (x1, x2, x3, x4)
+    # an optional argument names a checkpoint file, resumed from when it exists
+    checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
 
-    best_solution, best_result = meta.simulated_annealing(
-        function=salomon,
-        initial_solution=(x1, x2, x3, x4),
-        initial_temperature=10 ** 6,
-        cooling_schedule=lambda t, _: t * 0.9999,
+    # the hottest chain starts at the calibrated temperature and every next one is LADDER_RATIO colder
+    temperature = meta.calibrate_temperature(salomon, initial_solution, tweak, acceptance=ACCEPTANCE)
+    temperatures = meta.geometric_temperatures(temperature * LADDER_RATIO ** (CHAINS - 1), temperature, CHAINS)
+    best_solution, best_result = meta.lockstep_annealing(
+        batch_function=batch_salomon,
+        initial_solutions=[initial_solution] * CHAINS,
+        temperatures=temperatures,
+        cooling_schedule=[cooling_schedule(t, temperature) for temperature in temperatures],
         timeout=t,
-        tweak=tweak,
+        batch_tweak=batch_tweak,
+        checkpoint=checkpoint,
+        resume_from=resume_from,
     )
 
     print(*best_solution, best_result)
@@ -1,20 +1,44 @@
+import os
+import pickle
 import time
-from math import log
-from random import choice
-from typing import Any, Callable, List, Tuple, Union
+from math import inf, log
+from random import choice, getstate, setstate
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 Number = Union[float, int]
 Vector = Any
 VectorFunc = Callable[[Vector], float]
+PopulationFunc = Callable[[List[Vector]], List[float]]
 VectorCrossover = Callable[[List[Vector]], List[Vector]]
 VectorTweak = Callable[[Vector], Vector]
-VectorSelection = Callable[[List[Vector]], Vector]
+VectorSelection = Callable[[List[Vector], List[float]], Vector]
+
+# seconds between checkpoints of the population
+CHECKPOINT_INTERVAL = 60.0
 
 
 def now() -> float:
     return time.time()
 
 
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """
+    Writes the state of a search to path atomically:
+    to a temporary file first, which then replaces the previous checkpoint.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
 def ga(
     popsize: int,
     fitness: VectorFunc,
@@ -23,24 +47,85 @@ def ga(
     mutate: VectorTweak,
     selection: VectorSelection,
     timeout: Number,
+    population_fitness: Optional[PopulationFunc] = None,
+    lower_bound: float = -inf,
+    compact: Optional[Callable[[Vector], None]] = None,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    resume_from: Optional[str] = None,
 ) -> Tuple[Vector, float]:
-    population = first_generation
-    best = choice(population)
-
-    start = now()
-    last_best = now()
-    while now() - start < timeout and now() - last_best < log(timeout):
-        for individual in population:
-            if fitness(individual) < fitness(best):
-                best = individual
+    """
+    Every generation is scored once, by population_fitness if given,
+    and selection picks parents using these scores.
+    The search stops early once the best score reaches lower_bound.
+    If compact is given, it simplifies every individual in place before scoring.
+
+    With checkpoint, the population, its scores, the best individual
+    and the state of the random generator are saved to that file
+    every checkpoint_interval seconds and at the end.
+    resume_from continues from such a file instead of first_generation,
+    with the time already spent counting towards the timeout.
+    """
+    evaluate = population_fitness or (
+        lambda individuals: [fitness(individual) for individual in individuals]
+    )
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        population, scores = state["population"], state["scores"]
+        best, best_score = state["best"]
+        setstate(state["random"])
+        start = now() - state["elapsed"]
+        last_best = now() - state["since_best"]
+    else:
+        population = first_generation
+        if compact is not None:
+            for individual in population:
+                compact(individual)
+        scores = evaluate(population)
+        best, best_score = choice(list(zip(population, scores)))
+
+        start = now()
+        last_best = now()
+
+    def save():
+        state = {
+            "population": population,
+            "scores": scores,
+            "best": (best, best_score),
+            "random": getstate(),
+            "elapsed": now() - start,
+            "since_best": now() - last_best,
+        }
+        save_checkpoint(checkpoint, state)
+
+    last_checkpoint = now()
+    while (
+        now() - start < timeout
+        and now() - last_best < log(timeout)
+        and best_score > lower_bound
+    ):
+        for individual, score in zip(population, scores):
+            if score < best_score:
+                best, best_score = individual, score
                 last_best = now()
 
         next_generation = []
         for _ in range(popsize // 2):
-            parent_a = selection(population)
-            parent_b = selection(population)
+            parent_a = selection(population, scores)
+            parent_b = selection(population, scores)
             child_a, child_b = crossover([parent_a, parent_b])
-            next_generation.extend([mutate(child_a), mutate(child_b)])
+            children = [mutate(child_a), mutate(child_b)]
+            if compact is not None:
+                for child in children:
+                    compact(child)
+            next_generation.extend(children)
         population = next_generation
+        scores = evaluate(population)
+
+        if checkpoint is not None and now() - last_checkpoint >= checkpoint_interval:
+            save()
+            last_checkpoint = now()
 
-    return best, fitness(best)
+    if checkpoint is not None:
+        save()
+    return best, best_score
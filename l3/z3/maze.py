@@ -1,12 +1,19 @@
 from random import choice, random, randrange, shuffle
+import os
 import sys
+import time
+from array import array
+from collections import deque
 from enum import Enum
+from itertools import islice
 from typing import Any, List, Tuple
 
 try:
     from .ga import ga, Vector, VectorFunc, VectorTweak, VectorSelection
+    from .seeds import seed_walks
 except ImportError:
     from ga import ga, Vector, VectorFunc, VectorTweak, VectorSelection
+    from seeds import seed_walks
 
 
 class Move(Enum):
@@ -25,6 +32,19 @@ class Field(Enum):
 
 Path = List[Tuple[int, int]]
 
+MOVES = [move.value for move in Move]
+MOVE_INDEX = {move: index for index, move in enumerate(MOVES)}
+
+# transition targets meaning that the move reaches the exit or leaves the maze
+EXIT_CELL = -1
+OUTSIDE = -2
+
+# mazes with more fields get only a bound on the shortest path
+EXACT_LIMIT = 10 ** 6
+
+# largest share of the time limit spent on seed paths filling up the first generation
+SEED_SHARE = 0.1
+
 
 def tuple_sum(t1: tuple, t2: tuple):
     return tuple(sum(t) for t in zip(t1, t2))
@@ -41,30 +61,125 @@ class Maze:
         )
         self.size = len(maze_map) * len(maze_map[0])
         self.n, self.m = len(maze_map), len(maze_map[0])
+        self.start_cell = self.start[0] * self.m + self.start[1]
+        self.transitions = self.compile()
+
+    def compile(self) -> array:
+        """
+        Builds the table of the cell reached by every move from every cell.
+        The move with index k from cell c leads to transitions[4 * c + k].
+        """
+        transitions = array("i", [0] * (4 * self.size))
+        for x, row in enumerate(self.map):
+            for y in range(len(row)):
+                c = x * self.m + y
+                for k, move in enumerate(Move):
+                    nx, ny = tuple_sum((x, y), move.value)
+                    if nx not in range(self.n) or ny not in range(self.m):
+                        transitions[4 * c + k] = OUTSIDE
+                    elif self.map[nx][ny] == Field.EXIT.value:
+                        transitions[4 * c + k] = EXIT_CELL
+                    elif self.map[nx][ny] == Field.WALL.value:
+                        transitions[4 * c + k] = c
+                    else:
+                        transitions[4 * c + k] = nx * self.m + ny
+        return transitions
 
     def path_cost(self, path: Path) -> int:
-        pos = self.start
-        cost = 0
-        for i, move in enumerate(path):
-            cost = i + 1
-            if cost >= self.size:
-                return self.size
-
-            x, y = tuple_sum(pos, move)
-
-            if x not in range(self.n) or y not in range(self.m):
-                return self.size
-
-            if self.map[x][y] == Field.EXIT.value:
-                break
-
-            if self.map[x][y] != Field.WALL.value:
-                pos = x, y
-
-        return cost
+        return self.population_cost([path])[0]
+
+    def population_cost(self, population: List[Path]) -> List[int]:
+        """
+        Scores every path of a population with the compiled transition table.
+        """
+        transitions, size = self.transitions, self.size
+        costs = []
+        for path in population:
+            cell = self.start_cell
+            for cost, move in enumerate(islice(path, size - 1), 1):
+                cell = transitions[4 * cell + MOVE_INDEX[move]]
+                if cell < 0:
+                    costs.append(cost if cell == EXIT_CELL else size)
+                    break
+            else:
+                costs.append(len(path) if len(path) < size else size)
+        return costs
+
+    def lower_bound(self, exact_limit: int = EXACT_LIMIT) -> int:
+        """
+        Length of the shortest path to the exit,
+        found by breadth-first search over the transition table.
+        Mazes with more than exact_limit fields get the Manhattan distance
+        to the nearest exit instead. Returns 0 when there is no exit to reach.
+        """
+        exits = [
+            (i, j)
+            for i, row in enumerate(self.map)
+            for j, field in enumerate(row)
+            if field == Field.EXIT.value
+        ]
+        if not exits:
+            return 0
+        if self.size > exact_limit:
+            return min(
+                abs(x - self.start[0]) + abs(y - self.start[1]) for x, y in exits
+            )
+
+        distance = {self.start_cell: 0}
+        queue = deque([self.start_cell])
+        while queue:
+            cell = queue.popleft()
+            for target in self.transitions[4 * cell : 4 * cell + 4]:
+                if target == EXIT_CELL:
+                    return distance[cell] + 1
+                if target >= 0 and target not in distance:
+                    distance[target] = distance[cell] + 1
+                    queue.append(target)
+        return 0
+
+    def seed_paths(self, count: int, timeout: float) -> List[Path]:
+        """
+        Up to count distinct paths reaching the exit: a random shortest path,
+        branches of random search trees and noisy wall followers.
+        """
+        return [
+            [MOVES[k] for k in walk]
+            for walk in seed_walks(self.transitions, self.start_cell, count, timeout)
+        ]
+
+    def compact_path(self, path: Path) -> None:
+        """
+        Shortens a path reaching the exit in place: drops moves into walls,
+        cuts the loops between visits of the same cell and the moves after the exit.
+        Paths not reaching the exit are left as they are.
+        """
+        transitions = self.transitions
+        cells = [self.start_cell]
+        position = {self.start_cell: 0}
+        moves: Path = []
+        for move in path:
+            target = transitions[4 * cells[-1] + MOVE_INDEX[move]]
+            if target == EXIT_CELL:
+                moves.append(move)
+                path[:] = moves
+                return
+            if target < 0:
+                return
+            if target in position:
+                back = position[target]
+                for cell in cells[back + 1 :]:
+                    del position[cell]
+                del cells[back + 1 :]
+                del moves[back:]
+            else:
+                position[target] = len(cells)
+                cells.append(target)
+                moves.append(move)
 
     @staticmethod
     def tweak_path(path: Path) -> Path:
+        if len(path) < 2:
+            return path
         if random() < 0.6:
             i = randrange(len(path))
             j = randrange(len(path))
@@ -93,19 +208,19 @@ def crossover(parents):
 
 
 def tournament_selection(
-    population: List[Vector], fitness: VectorFunc, t: int
+    population: List[Vector], scores: List[float], t: int
 ) -> Vector:
-    best = choice(population)
+    best = randrange(len(population))
     for _ in range(1, t):
-        new = choice(population)
-        if fitness(new) < fitness(best):
+        new = randrange(len(population))
+        if scores[new] < scores[best]:
             best = new
-    return best
+    return population[best]
 
 
-def selection_factory(fitness: VectorFunc, t: int) -> VectorSelection:
-    def selection(population: List[Vector]) -> Vector:
-        return tournament_selection(population, fitness, t)
+def selection_factory(t: int) -> VectorSelection:
+    def selection(population: List[Vector], scores: List[float]) -> Vector:
+        return tournament_selection(population, scores, t)
 
     return selection
 
@@ -114,15 +229,27 @@ def main():
     t, n, _, s, p = map(int, input().split())
     maze = Maze([input() for _ in range(n)])
     solutions = [[Move[char].value for char in input().strip()] for _ in range(s)]
+    # an optional argument names a checkpoint file, resumed from when it exists
+    checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
+    start = time.time()
+    if len(solutions) < p and resume_from is None:
+        solutions += maze.seed_paths(p - len(solutions), t * SEED_SHARE)
+    seeding = time.time() - start
 
     path, cost = ga(
         popsize=p,
         fitness=maze.path_cost,
         crossover=crossover,
         mutate=maze.tweak_path,
-        selection=selection_factory(maze.path_cost, 4),
+        selection=selection_factory(4),
+        population_fitness=maze.population_cost,
+        compact=maze.compact_path,
+        lower_bound=maze.lower_bound(),
         first_generation=solutions,
-        timeout=t,
+        timeout=t - seeding,
+        checkpoint=checkpoint,
+        resume_from=resume_from,
     )
 
     print(cost)
@@ -0,0 +1,144 @@
+"""
+Generators of feasible maze paths used to seed the searches.
+
+They work on a compiled maze where the move with index k from cell c leads to
+transitions[4 * c + k]. A move into a wall leads back to c, a move reaching
+the exit leads to EXIT_CELL and other negative targets cannot be entered.
+Walks are lists of move indices.
+"""
+import time
+from itertools import cycle
+from random import choice, random, randrange, sample
+from typing import Dict, List, Optional, Sequence, Tuple
+
+EXIT_CELL = -1
+
+# probability of a random turn of the wall follower
+NOISE = 0.1
+
+Walk = List[int]
+
+
+def _trace_back(parent: Dict[int, Optional[Tuple[int, int]]], cell: int) -> Walk:
+    walk = []
+    step = parent[cell]
+    while step is not None:
+        cell, k = step
+        walk.append(k)
+        step = parent[cell]
+    walk.reverse()
+    return walk
+
+
+def random_tree_walk(transitions: Sequence[int], start: int) -> Optional[Walk]:
+    """
+    Grows a search tree from the start expanding a random frontier cell
+    each time and returns the tree branch leading to the exit.
+    """
+    parent: Dict[int, Optional[Tuple[int, int]]] = {start: None}
+    frontier = [start]
+    while frontier:
+        i = randrange(len(frontier))
+        frontier[i], frontier[-1] = frontier[-1], frontier[i]
+        cell = frontier.pop()
+        for k in sample(range(4), 4):
+            target = transitions[4 * cell + k]
+            if target == EXIT_CELL:
+                return _trace_back(parent, cell) + [k]
+            if target >= 0 and target not in parent:
+                parent[target] = cell, k
+                frontier.append(target)
+    return None
+
+
+def shortest_walk(transitions: Sequence[int], start: int) -> Optional[Walk]:
+    """
+    Shortest walk to the exit, breaking ties between shortest walks at random.
+    """
+    distance = {start: 0}
+    parents: Dict[int, List[Tuple[int, int]]] = {start: []}
+    exits: List[Tuple[int, int]] = []
+    level = [start]
+    while level and not exits:
+        next_level = []
+        for cell in level:
+            for k in range(4):
+                target = transitions[4 * cell + k]
+                if target == EXIT_CELL:
+                    exits.append((cell, k))
+                elif target >= 0 and target != cell:
+                    if target not in distance:
+                        distance[target] = distance[cell] + 1
+                        parents[target] = []
+                        next_level.append(target)
+                    if distance[target] == distance[cell] + 1:
+                        parents[target].append((cell, k))
+        level = next_level
+    if not exits:
+        return None
+
+    cell, k = choice(exits)
+    walk = [k]
+    while parents[cell]:
+        cell, k = choice(parents[cell])
+        walk.append(k)
+    walk.reverse()
+    return walk
+
+
+def wall_follower_walk(
+    transitions: Sequence[int], start: int, hand: int, noise: float, limit: int
+) -> Optional[Walk]:
+    """
+    Keeps a wall on the right (hand = 1) or left (hand = -1) side,
+    taking a random turn with probability noise.
+    Gives up after limit moves, which happens when the walk circles an island.
+    Relies on the moves being ordered clockwise.
+    """
+    cell, heading = start, randrange(4)
+    walk: Walk = []
+    while len(walk) < limit:
+        turns = sample(range(4), 4) if random() < noise else (hand, 0, -hand, 2)
+        for turn in turns:
+            k = (heading + turn) % 4
+            target = transitions[4 * cell + k]
+            if target == EXIT_CELL:
+                walk.append(k)
+                return walk
+            if target >= 0 and target != cell:
+                break
+        else:
+            return None
+        cell, heading = target, k
+        walk.append(k)
+    return None
+
+
+def seed_walks(
+    transitions: Sequence[int], start: int, count: int, timeout: float
+) -> List[Walk]:
+    """
+    Up to count distinct walks from the start to the exit, shorter than the
+    number of cells. Takes the generators in turn until there are count walks
+    or timeout seconds have passed. Returns no walks if the exit is unreachable.
+    """
+    limit = len(transitions) // 4 - 1
+    first = shortest_walk(transitions, start)
+    if first is None:
+        return []
+
+    walks = {tuple(first): None}
+    generators = cycle(
+        [
+            lambda: random_tree_walk(transitions, start),
+            lambda: wall_follower_walk(transitions, start, 1, NOISE, limit),
+            lambda: wall_follower_walk(transitions, start, -1, NOISE, limit),
+            lambda: shortest_walk(transitions, start),
+        ]
+    )
+    deadline = time.time() + timeout
+    while len(walks) < count and time.time() < deadline:
+        walk = next(generators)()
+        if walk is not None and len(walk) <= limit:
+            walks[tuple(walk)] = None
+    return [list(walk) for walk in walks][:count]
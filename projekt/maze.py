@@ -1,7 +1,11 @@
+import os
 import sys
 import random
+from array import array
+from collections import deque
 from enum import Enum
 from functools import lru_cache
+from itertools import islice
 from math import sqrt
 from random import choices
 from typing import List, Tuple
@@ -36,6 +40,14 @@ class Field(str, Enum):
 
 Path = List[Tuple[int, int]]
 
+MOVE_INDEX = {move.value: index for index, move in enumerate(Move)}
+
+# transition target meaning that the move reaches the exit
+EXIT_CELL = -1
+
+# mazes with more fields get only a bound on the shortest path
+EXACT_LIMIT = 10 ** 6
+
 
 @lru_cache(maxsize=None)
 def tuple_sum(t1: tuple, t2: tuple):
@@ -53,65 +65,174 @@ class Maze:
         )
         self.size = len(maze_map) * len(maze_map[0])
         self.n, self.m = len(maze_map), len(maze_map[0])
+        self.start_cell = self.cell(self.start)
+        self.transitions = self.compile()
+
+    def cell(self, pos: Tuple[int, int]) -> int:
+        x, y = pos
+        return x * self.m + y
+
+    def compile(self) -> array:
+        """
+        Builds the table of the cell reached by every move from every cell,
+        with walls, tunnel directions and the exit already applied.
+        The move with index k from cell c leads to transitions[4 * c + k].
+        """
+        transitions = array("i", [0] * (4 * self.size))
+        for x, row in enumerate(self.map):
+            for y, field in enumerate(row):
+                c = self.cell((x, y))
+                for k, move in enumerate(Move):
+                    transitions[4 * c + k] = c
+
+                    # in tunnel, move only in tunnel direction
+                    if not Field(field).tunnel_validate(move):
+                        continue
+
+                    nx, ny = tuple_sum((x, y), move)
+                    if nx not in range(self.n) or ny not in range(self.m):
+                        continue
+
+                    new_field = self.map[nx][ny]
+                    if new_field == Field.EXIT:
+                        transitions[4 * c + k] = EXIT_CELL
+                    # treat sides of tunnels as walls
+                    elif new_field != Field.WALL and Field(
+                        new_field
+                    ).tunnel_validate(move):
+                        transitions[4 * c + k] = self.cell((nx, ny))
+        return transitions
 
     def path_cost(self, path: Path) -> int:
-        pos = self.start
-        cost = 0
-        for i, move in enumerate(path):
-            cost = i + 1
-            if cost >= self.size:
-                return self.size
-
-            # in tunnel, move only in tunnel direction
-            cur_x, cur_y = pos
-            cur_field = self.map[cur_x][cur_y]
-            if not Field(cur_field).tunnel_validate(move):
-                continue
-
-            # new position
-            x, y = tuple_sum(pos, move)
-
-            new_field = self.map[x][y]
-            if new_field == Field.EXIT:
+        cell = self.start_cell
+        transitions = self.transitions
+        for cost, move in enumerate(islice(path, self.size - 1), 1):
+            cell = transitions[4 * cell + MOVE_INDEX[move]]
+            if cell == EXIT_CELL:
                 return cost
-
-            # treat sides of tunnels as walls
-            if (new_field != Field.WALL) and Field(new_field).tunnel_validate(move):
-                pos = x, y
-
         return self.size
 
+    def lower_bound(self, exact_limit: int = EXACT_LIMIT) -> int:
+        """
+        Length of the shortest path to the exit,
+        found by breadth-first search over the transition table.
+        Mazes with more than exact_limit fields get the Manhattan distance
+        to the nearest exit instead. Returns 0 when there is no exit to reach.
+        """
+        exits = [
+            (i, j)
+            for i, row in enumerate(self.map)
+            for j, field in enumerate(row)
+            if field == Field.EXIT
+        ]
+        if not exits:
+            return 0
+        if self.size > exact_limit:
+            return min(
+                abs(x - self.start[0]) + abs(y - self.start[1]) for x, y in exits
+            )
+
+        distance = {self.start_cell: 0}
+        queue = deque([self.start_cell])
+        while queue:
+            cell = queue.popleft()
+            for target in self.transitions[4 * cell : 4 * cell + 4]:
+                if target == EXIT_CELL:
+                    return distance[cell] + 1
+                if target >= 0 and target not in distance:
+                    distance[target] = distance[cell] + 1
+                    queue.append(target)
+        return 0
+
+    def compact_path(self, path: Path) -> None:
+        """
+        Shortens a path reaching the exit in place: drops moves into walls,
+        cuts the loops between visits of the same cell and the moves after the exit.
+        Paths not reaching the exit are left as they are.
+        """
+        transitions = self.transitions
+        cells = [self.start_cell]
+        position = {self.start_cell: 0}
+        moves: Path = []
+        for move in path:
+            target = transitions[4 * cells[-1] + MOVE_INDEX[move]]
+            if target == EXIT_CELL:
+                moves.append(move)
+                path[:] = moves
+                return
+            if target < 0:
+                return
+            if target in position:
+                back = position[target]
+                for cell in cells[back + 1 :]:
+                    del position[cell]
+                del cells[back + 1 :]
+                del moves[back:]
+            else:
+                position[target] = len(cells)
+                cells.append(target)
+                moves.append(move)
+
     @staticmethod
-    def tweak_path(path) -> Path:
+    def tweak_path(path: Path) -> meta.Undo:
+        """
+        Swaps two moves, replaces a segment with random moves or reverses it,
+        in place. Returns a function restoring the previous moves.
+        """
+        if len(path) < 2:
+            return lambda: None
         if random.random() < 0.75:  # swap moves
             i = random.randrange(len(path))
             j = random.randrange(len(path))
-            path[i], path[j] = path[j], path[i]
-            return path
+
+            def swap():
+                path[i], path[j] = path[j], path[i]
+
+            swap()
+            return swap
 
         i = random.randrange(len(path) - 1)
-        j = random.choice([c for c in range(len(path)) if c >= i])
+        j = random.randrange(i, len(path))
+        segment = path[i:j]
 
         if random.random() > 0.2:
-            return path[:i] + choices([m.value for m in Move], k=j - i) + path[j:]
+            path[i:j] = choices([m.value for m in Move], k=j - i)
+        else:
+            path[i:j] = segment[::-1]
 
-        return path[:i] + list(reversed(path[i:j])) + path[j:]
+        def restore():
+            path[i:j] = segment
+
+        return restore
 
 
 def main():
     t, n, m = map(int, input().split())
     maze = Maze([input() for _ in range(n)])
     initial_path = [Move[m].value for m in input().strip()]
+    # an optional argument names a checkpoint file, resumed from when it exists
+    checkpoint = sys.argv[1] if len(sys.argv) > 1 else None
+    resume_from = checkpoint if checkpoint and os.path.exists(checkpoint) else None
+
+    # worsening tweaks mostly lose the exit, so they should rarely be accepted
+    temperature = meta.calibrate_temperature(
+        maze.path_cost, initial_path, maze.tweak_path, acceptance=0.1, in_place=True
+    )
 
     path, cost = meta.simulated_annealing(
         function=maze.path_cost,
         initial_solution=initial_path,
-        initial_temperature=1.618,
-        cooling_schedule=lambda t: t * 0.85,
+        initial_temperature=temperature,
+        cooling_schedule=meta.deadline_schedule(t),
         tweak=maze.tweak_path,
         timeout=t,
-        deep_input=True,
+        in_place=True,
+        snapshot=list,
+        compact=maze.compact_path,
         local_timeout=sqrt(t),
+        lower_bound=maze.lower_bound(),
+        checkpoint=checkpoint,
+        resume_from=resume_from,
     )
     print(cost)
     print("".join(Move(move).name for move in path[:cost]), file=sys.stderr)
@@ -1,8 +1,10 @@
+import os
+import pickle
 import time
 from copy import deepcopy
-from math import exp
-from random import random
-from typing import Callable, Tuple, TypeVar
+from math import exp, inf, log
+from random import getstate, random, setstate
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
 
 
 def now() -> float:
@@ -10,6 +12,31 @@ def now() -> float:
 
 
 T = TypeVar("T")
+Undo = Callable[[], None]
+
+# temperature at the deadline relative to the initial one
+FINAL_RATIO = 1e-3
+
+# seconds between checkpoints of a search state
+CHECKPOINT_INTERVAL = 60.0
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    """
+    Writes the state of a search to path atomically:
+    to a temporary file first, which then replaces the previous checkpoint.
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as file:
+        return pickle.load(file)
 
 
 def simulated_annealing(
@@ -21,6 +48,13 @@ def simulated_annealing(
     timeout: float,
     local_timeout: float,
     deep_input=False,
+    in_place=False,
+    snapshot: Callable[[T], T] = deepcopy,
+    lower_bound: float = -inf,
+    compact: Optional[Callable[[T], None]] = None,
+    checkpoint: Optional[str] = None,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    resume_from: Optional[str] = None,
 ) -> Tuple[T, float]:
     """
     Returns a minimum of a given function via simulated annealing.
@@ -32,28 +66,73 @@ def simulated_annealing(
         cooling_schedule - function for calculating the next temperature
         tweak - solution tweak function
         timeout - algorithm timeout in seconds
+        local_timeout - seconds without an improvement of the best result
+            after which the search stops
         deep_input - whether to use deepcopy at tweak
+        in_place - whether tweak changes the solution in place and returns
+            a function undoing it, used instead of deep_input to roll back
+            rejected tweaks without copying
+        snapshot - function copying the solution when it becomes the best one,
+            used with in_place
+        lower_bound - known minimum of the function, stops the search once reached
+        compact - function simplifying the initial and every accepted solution
+            in place
+        checkpoint - file the state of the search is saved to every
+            checkpoint_interval seconds and at the end, together with the state
+            of the random generator
+        resume_from - checkpoint file to continue a search from, instead of
+            initial_solution and initial_temperature; the time already spent
+            counts towards the timeout
 
     Returns:
         Best solution found in a given time, function value in that solution
     """
-    temperature = initial_temperature
-    current_solution = initial_solution
-    best_solution = current_solution
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+        current_solution, current_result = state["current"]
+        best_solution, best_result = state["best"]
+        temperature = state["temperature"]
+        setstate(state["random"])
+        start = now() - state["elapsed"]
+        last_best = now() - state["since_best"]
+    else:
+        temperature = initial_temperature
+        current_solution = initial_solution
+        if compact is not None:
+            compact(current_solution)
+        best_solution = snapshot(current_solution) if in_place else current_solution
+
+        current_result = function(current_solution)
+        best_result = current_result
+
+        start = now()
+        last_best = now()
 
-    current_result = function(current_solution)
-    best_result = current_result
+    def save():
+        state = {
+            "current": (current_solution, current_result),
+            "best": (best_solution, best_result),
+            "temperature": temperature,
+            "random": getstate(),
+            "elapsed": now() - start,
+            "since_best": now() - last_best,
+        }
+        save_checkpoint(checkpoint, state)
 
-    start = now()
-    last_best = now()
+    last_checkpoint = now()
     while (
         now() - start <= timeout
         and temperature > 0
         and now() - last_best < local_timeout
+        and best_result > lower_bound
     ):
-        tweaked_solution = tweak(
-            deepcopy(current_solution) if deep_input else current_solution
-        )
+        if in_place:
+            undo = tweak(current_solution)
+            tweaked_solution = current_solution
+        else:
+            tweaked_solution = tweak(
+                deepcopy(current_solution) if deep_input else current_solution
+            )
         tweaked_result = function(tweaked_solution)
 
         if tweaked_result <= current_result or (
@@ -61,11 +140,81 @@ def simulated_annealing(
         ):
             current_solution = tweaked_solution
             current_result = tweaked_result
+            if compact is not None:
+                compact(current_solution)
+                current_result = function(current_solution)
 
+            if current_result < best_result:
+                last_best = now()
             if current_result <= best_result:
-                best_solution = current_solution
+                best_solution = (
+                    snapshot(current_solution) if in_place else current_solution
+                )
                 best_result = current_result
+        elif in_place:
+            undo()
 
         temperature = cooling_schedule(temperature)
 
+        if checkpoint is not None and now() - last_checkpoint >= checkpoint_interval:
+            save()
+            last_checkpoint = now()
+
+    if checkpoint is not None:
+        save()
     return best_solution, best_result
+
+
+def calibrate_temperature(
+    function: Callable[[T], float],
+    solution: T,
+    tweak: Callable[[T], T],
+    acceptance: float = 0.8,
+    samples: int = 100,
+    deep_input=False,
+    in_place=False,
+) -> float:
+    """
+    Temperature at which simulated annealing accepts a worsening tweak
+    of the solution with the given probability, for the mean worsening
+    of sampled tweaks.
+    The solution is left unchanged. Returns 1 when no sampled tweak is worse.
+    """
+    result = function(solution)
+    worsening = []
+    for _ in range(samples):
+        if in_place:
+            undo = tweak(solution)
+            delta = function(solution) - result
+            undo()
+        else:
+            tweaked = tweak(deepcopy(solution) if deep_input else solution)
+            delta = function(tweaked) - result
+        if delta > 0:
+            worsening.append(delta)
+    if not worsening:
+        return 1.0
+    return sum(worsening) / len(worsening) / -log(acceptance)
+
+
+def deadline_schedule(
+    timeout: float, final_ratio: float = FINAL_RATIO
+) -> Callable[[float], float]:
+    """
+    Cooling schedule falling geometrically with the elapsed time,
+    down to final_ratio of the initial temperature after timeout seconds,
+    so the whole time limit is spent annealing whatever the speed of a step.
+    Every call cools by the time since the previous one,
+    so a resumed search keeps its temperature.
+    """
+    last = now()
+
+    def schedule(temperature: float) -> float:
+        nonlocal last
+        current = now()
+        temperature *= final_ratio ** ((current - last) / timeout)
+        last = current
+        return temperature
+
+    return schedule
+